@@ -1,13 +1,24 @@
 from django.contrib import admin
-from .models import Issuer, Student, QRCodeCustomization, CertificateTemplate, CSVUpload, SampleCSV
+from .models import Issuer, Student, QRCodeCustomization, CertificateTemplate, CSVUpload, SampleCSV, QRArchive, RevokedCertificate
+from .signals import deleting_students
+
+class DeletingStudentsMixin:
+    """Invalidate caches once for all the students a deletion removes, cascades included"""
+    def delete_model(self, request, obj):
+        with deleting_students():
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with deleting_students():
+            super().delete_queryset(request, queryset)
 
 @admin.register(Issuer)
-class IssuerAdmin(admin.ModelAdmin):
+class IssuerAdmin(DeletingStudentsMixin, admin.ModelAdmin):
     list_display = ('name_en',)
     search_fields = ('name_en',)
 
 @admin.register(Student)
-class StudentAdmin(admin.ModelAdmin):
+class StudentAdmin(DeletingStudentsMixin, admin.ModelAdmin):
     list_display = ('noms_et_prenoms', 'matricule', 'filiere', 'mention', 'session', 'issuer', 'issue_date')
     list_filter = ('issuer', 'mention', 'session', 'filiere', 'issue_date')
     search_fields = ('noms_et_prenoms', 'matricule', 'numero', 'filiere')
@@ -15,8 +26,8 @@ class StudentAdmin(admin.ModelAdmin):
 
 @admin.register(QRCodeCustomization)
 class QRCodeCustomizationAdmin(admin.ModelAdmin):
-    list_display = ('id', 'foreground_color', 'background_color')
-    list_filter = ('foreground_color', 'background_color')
+    list_display = ('id', 'foreground_color', 'background_color', 'output_format', 'box_size')
+    list_filter = ('foreground_color', 'background_color', 'output_format')
 
 @admin.register(CertificateTemplate)
 class CertificateTemplateAdmin(admin.ModelAdmin):
@@ -26,10 +37,22 @@ class CertificateTemplateAdmin(admin.ModelAdmin):
 
 @admin.register(CSVUpload)
 class CSVUploadAdmin(admin.ModelAdmin):
-    list_display = ('id', 'file', 'uploaded_at')
-    readonly_fields = ('uploaded_at',)
+    list_display = ('id', 'file', 'uploaded_at', 'processed', 'total_records', 'successful_records', 'updated_records', 'failed_records')
+    readonly_fields = ('uploaded_at', 'started_at')
 
 @admin.register(SampleCSV)
 class SampleCSVAdmin(admin.ModelAdmin):
     list_display = ('id', 'file', 'created_at')
     readonly_fields = ('created_at',)
+
+@admin.register(QRArchive)
+class QRArchiveAdmin(admin.ModelAdmin):
+    list_display = ('id', 'issuer', 'session', 'student_count', 'built_at')
+    list_filter = ('issuer',)
+    readonly_fields = ('file', 'fingerprint', 'version', 'student_count', 'built_at')
+
+@admin.register(RevokedCertificate)
+class RevokedCertificateAdmin(admin.ModelAdmin):
+    list_display = ('student_id', 'reason', 'revoked_at')
+    search_fields = ('student_id', 'reason')
+    readonly_fields = ('revoked_at',)
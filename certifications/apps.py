@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CertificationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'certifications'
+
+    def ready(self):
+        from certifications import signals  # noqa: F401
+        from certifications.fonts import register_fonts
+        # Parse the bundled TTFs once per process rather than per certificate
+        register_fonts()
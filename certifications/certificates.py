@@ -0,0 +1,239 @@
+import hashlib
+import io
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from reportlab.lib.colors import HexColor
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from certifications.fonts import ARABIC_FONT, is_known_font, shape_text
+from certifications.models import CertificateTemplate, Student
+from certifications.qr import QRRenderer, shared_renderer
+
+PAGE_SIZE = landscape(A4)
+
+# Bump when the layout changes so cached certificates are rendered again
+CERTIFICATE_RENDER_VERSION = 2
+
+# Rendered certificates served by the certificate_pdf view, one directory per student
+CERTIFICATE_CACHE_DIR = 'certificate_cache'
+
+# Certificates can be corrected, so clients revalidate with the ETag once stale
+CERTIFICATE_CACHE_CONTROL = 'public, max-age=3600'
+
+# Student and template fields a certificate is drawn from
+CERTIFICATE_STUDENT_FIELDS = [
+    'noms_et_prenoms', 'date_de_naissance', 'lieu_de_naissance', 'matricule', 'mention', 'session', 'filiere',
+    'numero',
+]
+CERTIFICATE_TEMPLATE_FIELDS = [
+    'background_image', 'font', 'title_font_size', 'body_font_size', 'text_color', 'qr_code_position',
+]
+
+# Side of the QR code and distance to the page edges, in points
+CERTIFICATE_QR_SIZE = 110
+CERTIFICATE_MARGIN = 40
+
+def default_template():
+    """Template of students without one: the first template, or the field defaults"""
+    return CertificateTemplate.objects.order_by('id').first() or CertificateTemplate(name='Default')
+
+
+class CertificateEngine:
+    """
+    Render certificate PDFs for many students.
+
+    Fonts are registered when the app is ready and shaped text is memoised
+    (see certifications.fonts). The background image of each template, issuer
+    signatures and the QR settings are loaded the first time they are needed
+    and reused for the following students. Students should come with
+    select_related('issuer', 'template').
+    """
+
+    def __init__(self, qr_renderer=None, template=None):
+        self.qr_renderer = qr_renderer or QRRenderer()
+        self.default_template = template or default_template()
+        self._backgrounds = {}
+        self._signatures = {}
+        self._logo = ImageReader(self.qr_renderer.logo) if self.qr_renderer.logo is not None else None
+
+    def template_for(self, student):
+        return student.template or self.default_template
+
+    def render(self, student):
+        """PDF bytes of one student's certificate"""
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=PAGE_SIZE, pageCompression=1)
+        self.draw(pdf, student)
+        pdf.save()
+        return buffer.getvalue()
+
+    def draw(self, pdf, student):
+        """Draw a student's certificate as a page of `pdf`"""
+        template = self.template_for(student)
+        width, height = PAGE_SIZE
+
+        background = self._background(template)
+        if background is not None:
+            pdf.drawImage(background, 0, 0, width=width, height=height)
+
+        body_font = template.font if is_known_font(template.font) else 'Helvetica'
+        title_font = f'{body_font}-Bold' if is_known_font(f'{body_font}-Bold') else body_font
+        pdf.setFillColor(HexColor(template.text_color))
+
+        self._draw_line(pdf, '', 'ATTESTATION DE RÉUSSITE', height * 0.74, title_font, template.title_font_size)
+        y = height * 0.62
+        for label, value in self._body_lines(student):
+            self._draw_line(pdf, label, value, y, body_font, template.body_font_size)
+            y -= template.body_font_size * 1.8
+
+        signature = self._signature(student.issuer)
+        if signature is not None:
+            pdf.drawImage(
+                signature, width / 2 - 75, CERTIFICATE_MARGIN, width=150, height=60,
+                preserveAspectRatio=True, mask='auto',
+            )
+
+        x, y = self._qr_origin(template.qr_code_position)
+        self.draw_qr(pdf, student.id, x, y, CERTIFICATE_QR_SIZE)
+        pdf.showPage()
+
+    def _body_lines(self, student):
+        """(label, value) of each body line; values are shaped on their own so they are memoised across students"""
+        lines = [('Délivrée à ', student.noms_et_prenoms or '')]
+        if student.date_de_naissance:
+            lines.append(('Né(e) le ', student.date_de_naissance.strftime('%d/%m/%Y')))
+        if student.lieu_de_naissance:
+            lines.append(('Lieu de naissance : ', student.lieu_de_naissance))
+        for label, value in [
+            ('Filière', student.filiere),
+            ('Mention', student.mention),
+            ('Session', student.session),
+            ('Matricule', student.matricule),
+            ('Numéro', student.numero),
+        ]:
+            if value:
+                lines.append((f'{label} : ', value))
+        lines.append(('', student.issuer.name_en))
+        return lines
+
+    def _draw_line(self, pdf, label, value, y, font, size):
+        shaped, is_arabic = shape_text(value)
+        pdf.setFont(ARABIC_FONT if is_arabic else font, size)
+        pdf.drawCentredString(PAGE_SIZE[0] / 2, y, label + shaped)
+
+    def _qr_origin(self, position):
+        width, height = PAGE_SIZE
+        left = CERTIFICATE_MARGIN
+        right = width - CERTIFICATE_MARGIN - CERTIFICATE_QR_SIZE
+        bottom = CERTIFICATE_MARGIN
+        top = height - CERTIFICATE_MARGIN - CERTIFICATE_QR_SIZE
+        return {
+            'top_left': (left, top),
+            'top_right': (right, top),
+            'bottom_left': (left, bottom),
+        }.get(position, (right, bottom))
+
+    def draw_qr(self, pdf, student_id, x, y, size):
+        """Draw a student's QR code as vector modules, one rectangle per run of dark modules"""
+        renderer = self.qr_renderer
+        matrix = renderer.matrix(student_id)
+        module = size / len(matrix)
+
+        pdf.saveState()
+        pdf.setFillColorRGB(*[channel / 255 for channel in renderer.back_color[:3]])
+        pdf.rect(x, y, size, size, stroke=0, fill=1)
+        pdf.setFillColorRGB(*[channel / 255 for channel in renderer.fill_color[:3]])
+        path = pdf.beginPath()
+        for row_index, row in enumerate(matrix):
+            row_y = y + size - (row_index + 1) * module
+            start = None
+            for column, dark in enumerate(row + [False]):
+                if dark and start is None:
+                    start = column
+                elif not dark and start is not None:
+                    path.rect(x + start * module, row_y, (column - start) * module, module)
+                    start = None
+        pdf.drawPath(path, stroke=0, fill=1)
+        if self._logo is not None:
+            logo_size = size / 4
+            pdf.drawImage(self._logo, x + (size - logo_size) / 2, y + (size - logo_size) / 2,
+                          width=logo_size, height=logo_size, mask='auto')
+        pdf.restoreState()
+
+    def _background(self, template):
+        if not template.background_image:
+            return None
+        key = (template.pk, template.background_image.name)
+        if key not in self._backgrounds:
+            self._backgrounds[key] = ImageReader(template.background_image.path)
+        return self._backgrounds[key]
+
+    def _signature(self, issuer):
+        if not issuer.signature:
+            return None
+        key = (issuer.pk, issuer.signature.name)
+        if key not in self._signatures:
+            self._signatures[key] = ImageReader(issuer.signature.path)
+        return self._signatures[key]
+
+
+def certificate_cache_key(student, template, qr_renderer):
+    """Hash of everything a student's certificate is drawn from"""
+    values = [str(CERTIFICATE_RENDER_VERSION), str(student.id), qr_renderer.fingerprint]
+    values += [str(getattr(student, field) or '') for field in CERTIFICATE_STUDENT_FIELDS]
+    values += [student.issuer.name_en, student.issuer.signature.name or '']
+    values += [str(template.pk)] + [str(getattr(template, field) or '') for field in CERTIFICATE_TEMPLATE_FIELDS]
+    return hashlib.sha256('|'.join(values).encode()).hexdigest()
+
+
+def certificate_cache_path(student_id, key):
+    return f'{CERTIFICATE_CACHE_DIR}/{student_id}/{key}.pdf'
+
+
+def cached_certificate(student):
+    """
+    Return (cache key, storage path) of a student's certificate, rendering it
+    only if no certificate was stored for the same inputs.
+    """
+    qr_renderer = shared_renderer()
+    template = student.template or default_template()
+    key = certificate_cache_key(student, template, qr_renderer)
+    path = certificate_cache_path(student.id, key)
+    if not default_storage.exists(path):
+        pdf = CertificateEngine(qr_renderer, template).render(student)
+        saved_path = default_storage.save(path, ContentFile(pdf))
+        if saved_path != path:
+            # Another request stored the same certificate in the meantime
+            default_storage.delete(saved_path)
+    return key, path
+
+
+def invalidate_student_certificates(student_ids):
+    """Delete the cached certificates of the given students"""
+    student_ids = {str(student_id) for student_id in student_ids}
+    if len(student_ids) > 1:
+        # One listing of the cache rather than one per student
+        try:
+            cached, _ = default_storage.listdir(CERTIFICATE_CACHE_DIR)
+        except FileNotFoundError:
+            return
+        student_ids.intersection_update(cached)
+    for student_id in student_ids:
+        directory = f'{CERTIFICATE_CACHE_DIR}/{student_id}'
+        try:
+            _, files = default_storage.listdir(directory)
+        except FileNotFoundError:
+            continue
+        for name in files:
+            default_storage.delete(f'{directory}/{name}')
+
+
+def invalidate_template_certificates(template):
+    """Delete the cached certificates drawn with a template"""
+    students = Student.objects.filter(template=template)
+    if template.pk == CertificateTemplate.objects.order_by('id').values_list('pk', flat=True).first():
+        # Also the template of students without one
+        students = Student.objects.filter(Q(template=template) | Q(template__isnull=True))
+    invalidate_student_certificates(students.values_list('id', flat=True).iterator())
@@ -0,0 +1,309 @@
+import csv
+import io
+import json
+import tempfile
+import zipfile
+import zlib
+from datetime import date, datetime
+from itertools import islice
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.text import slugify
+from certifications.models import QRArchive, Student
+from certifications.qr import QRRenderer, qr_code_path_from_link
+from openpyxl import Workbook
+
+# Students fetched per query while exporting
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+QR_ARCHIVE_NAME = 'student_qr_codes_and_data.zip'
+
+# Header handing pre-built archives to the web server, None sends them from Django
+EXPORT_SENDFILE_HEADER = getattr(settings, 'EXPORT_SENDFILE_HEADER', None)
+# Prefix of the header value, followed by the archive's storage name
+EXPORT_SENDFILE_ROOT = getattr(settings, 'EXPORT_SENDFILE_ROOT', '')
+
+# (CSV/XLSX header, JSON key, lookup) of the exported student columns
+STUDENT_EXPORT_COLUMNS = [
+    ('Noms et Prénoms', 'noms_et_prenoms', 'noms_et_prenoms'),
+    ('Matricule', 'matricule', 'matricule'),
+    ('Filière', 'filiere', 'filiere'),
+    ('Mention', 'mention', 'mention'),
+    ('Session', 'session', 'session'),
+    ('Sexe', 'sexe', 'sexe'),
+    ('Date de Naissance', 'date_de_naissance', 'date_de_naissance'),
+    ('Lieu de Naissance', 'lieu_de_naissance', 'lieu_de_naissance'),
+    ('Numéro', 'numero', 'numero'),
+    ('Issuer', 'issuer', 'issuer__name_en'),
+    ('Issue Date', 'issue_date', 'issue_date'),
+    ('QR Code Link', 'qr_code_link', 'qr_code_link'),
+]
+STUDENT_CSV_HEADER = [header for header, _, _ in STUDENT_EXPORT_COLUMNS]
+
+# Bytes of output gathered before a chunk is handed out
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+class ZipStream:
+    """
+    Write-only sink for zipfile.ZipFile.
+
+    It has no seek(), so ZipFile writes entries sequentially with data
+    descriptors; the bytes written so far are handed out by drain().
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_qr_archive(students, renderer=None):
+    """
+    Yield a ZIP of the students' data as CSV and their QR images, entry by entry.
+
+    Students are streamed twice (CSV rows, then images) so memory does not
+    grow with the number of students. Images that are not stored are rendered.
+    """
+    renderer = renderer or QRRenderer()
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('student_data.csv', 'w') as csv_entry:
+            csv_text = io.TextIOWrapper(csv_entry, encoding='utf-8', newline='')
+            csv_writer = csv.writer(csv_text)
+            csv_writer.writerow(STUDENT_CSV_HEADER)
+            for count, row in enumerate(iter_student_rows(students), 1):
+                csv_writer.writerow(row)
+                if count % EXPORT_CHUNK_SIZE == 0:
+                    csv_text.flush()
+                    yield stream.drain()
+            csv_text.flush()
+            csv_text.detach()
+        yield stream.drain()
+
+        links = students.exclude(qr_code_link__isnull=True).exclude(qr_code_link='')
+        rows = links.values_list('id', 'qr_code_link').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        while chunk := list(islice(rows, EXPORT_CHUNK_SIZE)):
+            renderer.preload(student_id for student_id, _ in chunk)
+            for student_id, qr_code_link in chunk:
+                qr_code_path = qr_code_path_from_link(qr_code_link)
+                try:
+                    with default_storage.open(qr_code_path, 'rb') as qr_file:
+                        image = qr_file.read()
+                    extension = qr_code_path.rsplit('.', 1)[-1]
+                except FileNotFoundError:
+                    # Linked to the on-demand view, nothing stored
+                    image = renderer.render(student_id)
+                    extension = renderer.extension
+                # PNGs are already compressed
+                compress_type = zipfile.ZIP_STORED if extension == 'png' else zipfile.ZIP_DEFLATED
+                archive.writestr(f'qr_codes/student_{student_id}.{extension}', image, compress_type=compress_type)
+                yield stream.drain()
+    yield stream.drain()
+
+
+def iter_student_rows(students):
+    """Exported column values of the students, one tuple per student, in one server-side query"""
+    lookups = [lookup for _, _, lookup in STUDENT_EXPORT_COLUMNS]
+    return students.values_list(*lookups).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def iter_students_csv(students):
+    """Yield the students as UTF-8 CSV, a few rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(STUDENT_CSV_HEADER)
+    for row in iter_student_rows(students):
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def iter_students_jsonl(students):
+    """Yield the students as JSON Lines, one object per student"""
+    keys = [key for _, key, _ in STUDENT_EXPORT_COLUMNS]
+    lines = []
+    size = 0
+    for row in iter_student_rows(students):
+        line = json.dumps(dict(zip(keys, row)), ensure_ascii=False, default=_json_value) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_BUFFER_SIZE:
+            yield ''.join(lines).encode('utf-8')
+            lines = []
+            size = 0
+    yield ''.join(lines).encode('utf-8')
+
+
+def iter_students_xlsx(students):
+    """
+    Yield the students as an XLSX workbook.
+
+    openpyxl's write-only mode streams rows to a temporary file, but the
+    workbook can only be zipped once complete, so it is sent after being built.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Students')
+    sheet.append(STUDENT_CSV_HEADER)
+    for row in iter_student_rows(students):
+        # Excel has no time zones
+        sheet.append([
+            timezone.make_naive(value) if isinstance(value, datetime) and timezone.is_aware(value) else value
+            for value in row
+        ])
+    with tempfile.TemporaryFile() as workbook_file:
+        workbook.save(workbook_file)
+        workbook_file.seek(0)
+        while True:
+            data = workbook_file.read(EXPORT_BUFFER_SIZE)
+            if not data:
+                break
+            yield data
+
+
+# name: (content type, generator); XLSX is already compressed, so never gzipped
+STUDENT_EXPORT_FORMATS = {
+    'csv': ('text/csv', iter_students_csv),
+    'jsonl': ('application/x-ndjson', iter_students_jsonl),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', iter_students_xlsx),
+}
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of byte chunks on the fly"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for data in chunks:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def student_export(students, export_format, gzip=False):
+    """
+    Return (content type, file name, byte chunks) of a student export.
+
+    `gzip` is ignored for XLSX.
+    """
+    content_type, iter_export = STUDENT_EXPORT_FORMATS[export_format]
+    chunks = iter_export(students)
+    file_name = f'students.{export_format}'
+    if gzip and export_format != 'xlsx':
+        chunks = gzip_chunks(chunks)
+        content_type = 'application/gzip'
+        file_name += '.gz'
+    return content_type, file_name, chunks
+
+
+def filter_students(issuer_id=None, session='', filiere=''):
+    """Students of an export, in a stable order"""
+    students = Student.objects.order_by('id')
+    if issuer_id:
+        students = students.filter(issuer_id=issuer_id)
+    if session:
+        students = students.filter(session=session)
+    if filiere:
+        students = students.filter(filiere=filiere)
+    return students
+
+
+def cached_qr_archive(issuer_id, session, renderer):
+    """The built archive of a slice if it is still current, else None"""
+    archive = QRArchive.objects.filter(issuer_id=issuer_id, session=session).exclude(file='').first()
+    if archive is None or archive.fingerprint != renderer.fingerprint:
+        return None
+    return archive
+
+
+def build_qr_archive(issuer_id, session=''):
+    """
+    Write the archive of one (issuer, session) slice to storage.
+
+    The slice's version is read first; if a student of the slice changes
+    while the archive is written, the version moves on and the new file is
+    thrown away instead of being recorded. Returns the QRArchive, or None
+    when the build was discarded.
+    """
+    archive, _ = QRArchive.objects.get_or_create(issuer_id=issuer_id, session=session)
+    version = archive.version
+    renderer = QRRenderer()
+    students = filter_students(issuer_id, session)
+    student_count = students.count()
+
+    with tempfile.TemporaryFile() as archive_file:
+        for data in iter_qr_archive(students, renderer):
+            archive_file.write(data)
+        archive_file.seek(0)
+        file_name = f"issuer_{issuer_id}_{slugify(session) or 'all'}.zip"
+        name = default_storage.save(QRArchive.file.field.upload_to + file_name, File(archive_file))
+
+    built = QRArchive.objects.filter(pk=archive.pk, version=version).update(
+        file=name,
+        fingerprint=renderer.fingerprint,
+        student_count=student_count,
+        built_at=timezone.now(),
+    )
+    if not built:
+        default_storage.delete(name)
+        return None
+    if archive.file and archive.file.name != name:
+        default_storage.delete(archive.file.name)
+    archive.refresh_from_db()
+    return archive
+
+
+def invalidate_qr_archives(slices=None):
+    """
+    Drop the built archives covering any of the (issuer_id, session) slices.
+
+    A session of None stands for every session of the issuer, and no slices
+    at all for every archive. The all-sessions archive of an issuer is
+    dropped along with any of its sessions.
+    """
+    if slices is None:
+        query = Q()
+    else:
+        sessions_by_issuer = {}
+        for issuer_id, session in slices:
+            sessions_by_issuer.setdefault(issuer_id, set()).add(session)
+        if not sessions_by_issuer:
+            return
+        query = Q()
+        for issuer_id, sessions in sessions_by_issuer.items():
+            if None in sessions:
+                query |= Q(issuer_id=issuer_id)
+            else:
+                query |= Q(issuer_id=issuer_id, session__in=sessions | {''})
+
+    archives = QRArchive.objects.filter(query)
+    names = list(archives.exclude(file='').values_list('file', flat=True))
+    archives.update(version=F('version') + 1, file='', built_at=None)
+    for name in names:
+        default_storage.delete(name)
@@ -0,0 +1,53 @@
+"""
+Fonts available to reportlab and shaping of the text drawn with them.
+
+The bundled TTFs are parsed once per process, when the app is ready, and
+shaped strings are memoised: names, filieres and mentions repeat across a
+cohort, and arabic-reshaper plus bidi cost far more than a dict lookup.
+"""
+import re
+from functools import lru_cache
+import arabic_reshaper
+from bidi.algorithm import get_display
+from django.conf import settings
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+# TrueType fonts shipped in static/, by the name templates refer to them with
+FONT_FACES = {
+    'Almarai': 'Almarai-Regular.ttf',
+    'Almarai-Bold': 'Almarai-Bold.ttf',
+    'Almarai-Light': 'Almarai-Light.ttf',
+    'Almarai-ExtraBold': 'Almarai-ExtraBold.ttf',
+}
+# Used for text the template's font has no glyphs for
+ARABIC_FONT = 'Almarai'
+
+# Shaped strings kept per process
+SHAPED_TEXT_CACHE_SIZE = getattr(settings, 'SHAPED_TEXT_CACHE_SIZE', 65536)
+
+ARABIC_RE = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]')
+
+
+def register_fonts():
+    """Register the bundled TrueType fonts with reportlab, skipping those already registered"""
+    registered = pdfmetrics.getRegisteredFontNames()
+    for name, file_name in FONT_FACES.items():
+        if name not in registered:
+            pdfmetrics.registerFont(TTFont(name, str(settings.BASE_DIR / 'static' / file_name)))
+
+
+def is_known_font(name):
+    return name in pdfmetrics.standardFonts or name in pdfmetrics.getRegisteredFontNames()
+
+
+@lru_cache(maxsize=SHAPED_TEXT_CACHE_SIZE)
+def shape_text(text):
+    """
+    Return (text as it must be drawn, whether it needs ARABIC_FONT).
+
+    Arabic is reshaped and put in visual order, other text is returned as is.
+    """
+    if not ARABIC_RE.search(text):
+        return text, False
+    return get_display(arabic_reshaper.reshape(text)), True
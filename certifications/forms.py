@@ -1,4 +1,6 @@
 from django import forms
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
 from django.core.exceptions import ValidationError
 from .models import CertificateTemplate, Student, Issuer
 
@@ -73,18 +75,18 @@ class StudentForm(forms.ModelForm):
 
 class CSVUploadForm(forms.Form):
     csv_file = forms.FileField(
-        label='Select a CSV file',
-        help_text='Max. 5 megabytes',
+        label='Select a CSV or Excel (.xlsx) file',
+        help_text=f'Max. {filesizeformat(settings.CSV_UPLOAD_MAX_SIZE)}',
         widget=forms.ClearableFileInput(attrs={'class': 'form-control-file'})
     )
 
     def clean_csv_file(self):
         csv_file = self.cleaned_data['csv_file']
         if csv_file:
-            if csv_file.size > 5 * 1024 * 1024:  # 5 MB limit
-                raise forms.ValidationError("File size must be under 5 MB.")
-            if not csv_file.name.endswith('.csv'):
-                raise forms.ValidationError("File must be a CSV.")
+            if csv_file.size > settings.CSV_UPLOAD_MAX_SIZE:
+                raise forms.ValidationError(f"File size must be under {filesizeformat(settings.CSV_UPLOAD_MAX_SIZE)}.")
+            if not csv_file.name.lower().endswith(('.csv', '.xlsx')):
+                raise forms.ValidationError("File must be a CSV or an Excel (.xlsx) workbook.")
         return csv_file
 
 class IssuerForm(forms.ModelForm):
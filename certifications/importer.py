@@ -0,0 +1,463 @@
+import codecs
+import csv
+import io
+from datetime import date, datetime
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from certifications.exports import invalidate_qr_archives
+from certifications.models import Student, Issuer
+from certifications.qr import QR_FIELDS, QRRenderer
+from certifications.tokens import expire_student_tokens
+from certifications.verification import invalidate_issuer_student_counts, invalidate_verification_pages
+
+# Rows looked up against the database in a single query
+IMPORT_CHUNK_SIZE = getattr(settings, 'IMPORT_CHUNK_SIZE', 500)
+# Rows sent per INSERT/UPDATE statement by bulk_create/bulk_update
+IMPORT_BATCH_SIZE = getattr(settings, 'IMPORT_BATCH_SIZE', 500)
+
+# Candidate encodings for uploaded CSV files, in order of preference
+CSV_ENCODINGS = ['utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
+# Bytes read at a time from uploaded files, the first block is used to sniff the encoding
+CSV_READ_BLOCK_SIZE = 64 * 1024
+
+STUDENT_FIELDS = [
+    'noms_et_prenoms',
+    'matricule',
+    'filiere',
+    'mention',
+    'session',
+    'sexe',
+    'lieu_de_naissance',
+    'numero',
+]
+
+
+class ImportResult:
+    """Counters and error messages collected while importing rows"""
+
+    def __init__(self, processed_count=0, success_count=0, error_count=0, update_count=0):
+        self.processed_count = processed_count
+        self.success_count = success_count
+        self.update_count = update_count
+        self.skip_count = processed_count - success_count - error_count - update_count
+        self.error_count = error_count
+        self.error_messages = []
+
+    def add_success(self, row_number, message=''):
+        self.success_count += 1
+
+    def add_update(self, row_number, message):
+        self.update_count += 1
+
+    def add_skip(self, row_number, message):
+        self.skip_count += 1
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        self.error_messages.append(f"Error in row {row_number}: {message}")
+
+
+class ValidationReport(ImportResult):
+    """ImportResult that also writes the outcome of every row to a CSV file"""
+
+    def __init__(self, report_file):
+        super().__init__()
+        self.writer = csv.writer(report_file)
+        self.writer.writerow(['row', 'status', 'message'])
+        self.pending = []
+
+    def add_success(self, row_number, message=''):
+        super().add_success(row_number, message)
+        self.pending.append((row_number, 'ok', message))
+
+    def add_update(self, row_number, message):
+        super().add_update(row_number, message)
+        self.pending.append((row_number, 'update', message))
+
+    def add_skip(self, row_number, message):
+        super().add_skip(row_number, message)
+        self.pending.append((row_number, 'skip', message))
+
+    def add_error(self, row_number, message):
+        super().add_error(row_number, message)
+        self.pending.append((row_number, 'error', message))
+
+    def flush(self):
+        """Write the rows of the current chunk in file order"""
+        self.writer.writerows(sorted(self.pending))
+        self.pending = []
+
+
+def convert_date_format(date_str):
+    """Convert date from DD/MM/YYYY to YYYY-MM-DD format"""
+    if not date_str:
+        return None
+    try:
+        # Parse the date string in DD/MM/YYYY format
+        date_obj = datetime.strptime(date_str.strip(), '%d/%m/%Y')
+        # Convert to YYYY-MM-DD format
+        return date_obj.strftime('%Y-%m-%d')
+    except ValueError:
+        try:
+            # Try parsing as YYYY-MM-DD in case it's already in the correct format
+            datetime.strptime(date_str.strip(), '%Y-%m-%d')
+            return date_str.strip()
+        except ValueError:
+            return None
+
+
+def detect_encoding(sample):
+    """Pick the first candidate encoding able to decode the start of a file"""
+    for encoding in CSV_ENCODINGS:
+        try:
+            # final=False tolerates a multi-byte character cut at the end of the sample
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError('Unable to decode CSV file. Please ensure it is properly encoded.')
+
+
+def iter_csv_rows(csv_file):
+    """
+    Yield the rows of a CSV file as dicts without loading it in memory.
+
+    The encoding is sniffed from the first block, the rest of the file is
+    decoded incrementally while the csv module consumes it.
+    """
+    csv_file.seek(0)
+    encoding = detect_encoding(csv_file.read(CSV_READ_BLOCK_SIZE))
+    csv_file.seek(0)
+
+    binary_file = getattr(csv_file, 'file', csv_file)
+    text_file = io.TextIOWrapper(binary_file, encoding=encoding, newline='')
+    try:
+        yield from csv.DictReader(text_file)
+    except UnicodeDecodeError as e:
+        raise ValueError(f'Unable to decode CSV file as {encoding} near byte {e.start}.')
+    finally:
+        # Hand the underlying file back to its owner instead of closing it
+        if not text_file.closed:
+            text_file.detach()
+
+
+def count_csv_rows(csv_file):
+    """Count the data rows of a CSV file, streaming it like iter_csv_rows"""
+    return sum(1 for _ in iter_csv_rows(csv_file))
+
+
+def chunked(iterable, size):
+    """Yield lists of at most `size` items from `iterable`"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def clean_row(row):
+    """Strip the raw CSV values of a row into Student field values"""
+    data = {field: row.get(field, '').strip() for field in STUDENT_FIELDS}
+    data['date_de_naissance'] = convert_date_format(row.get('date_de_naissance', '').strip())
+    data['issuer_name_en'] = row.get('issuer_name_en', '').strip()
+    return data
+
+
+def import_students(rows, chunk_size=None, batch_size=None, on_progress=None, clean=clean_row, result=None,
+                    upsert=False):
+    """
+    Import an iterable of CSV rows (dicts) as Student records.
+
+    Existing matricules, numeros and issuers are loaded with one query per
+    chunk, new students are inserted with bulk_create and their QR code links
+    are written back with bulk_update. Rows are counted exactly like the
+    historical row-by-row loop: a missing matricule or issuer is an error, an
+    already known matricule (in the database or earlier in the file) is a skip.
+
+    Each chunk is committed in its own transaction, so the database write lock
+    is only held for one chunk at a time. `on_progress` is called with the
+    running ImportResult inside that transaction, letting callers record the
+    committed offset atomically with the rows. Passing the `result` of an
+    interrupted import resumes it: its first `processed_count` rows are skipped.
+    `clean` turns a raw row into Student field values and raises to reject it.
+    Cached export archives and student counts of the issuers and sessions
+    touched by a chunk, and the verification pages of the students it updated,
+    are dropped once it is committed.
+
+    With `upsert`, rows whose matricule already exists update that student
+    instead of being skipped; only the columns that actually differ are
+    written, and QR codes are only regenerated when their inputs changed.
+    """
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    result = result or ImportResult()
+    planner = ImportPlanner(result, clean, upsert=upsert)
+    renderer = QRRenderer()
+
+    rows = islice(rows, result.processed_count, None)
+    for chunk in chunked(enumerate(rows, result.processed_count + 1), chunk_size):
+        with transaction.atomic():
+            inserts, updates = planner.plan(chunk)
+            _insert_students(inserts, result, batch_size, renderer)
+            _update_students(updates, result, batch_size, renderer)
+            result.processed_count += len(chunk)
+            if on_progress:
+                on_progress(result)
+
+        touched = {(data['issuer'].pk, data['session'] or '') for _, data in inserts}
+        touched.update((student.issuer_id, student.session or '') for _, student, _ in updates)
+        slices = touched | planner.previous_slices
+        planner.previous_slices.clear()
+        invalidate_qr_archives(slices)
+        invalidate_verification_pages(student.pk for _, student, _ in updates)
+        invalidate_issuer_student_counts(issuer_id for issuer_id, _ in slices)
+
+    return result
+
+
+def validate_students(rows, result, chunk_size=None, on_progress=None, clean=clean_row, upsert=False):
+    """
+    Check every row the way import_students would, without writing anything.
+
+    The same per-chunk set lookups are used, plus file-wide sets so
+    duplicates inside the file are reported even across chunks. Each row's
+    outcome is recorded on `result`, a ValidationReport.
+    """
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    planner = ImportPlanner(result, clean, create_issuers=False, upsert=upsert)
+
+    for chunk in chunked(enumerate(rows, 1), chunk_size):
+        inserts, updates = planner.plan(chunk)
+        for row_number, data in inserts:
+            if data['issuer'] is None:
+                result.add_success(row_number, f"Issuer {data['issuer_name_en']} will be created")
+            else:
+                result.add_success(row_number)
+        for row_number, student, changed in updates:
+            result.add_update(row_number, f"Will update {', '.join(changed)}")
+        result.flush()
+        result.processed_count += len(chunk)
+        if on_progress:
+            on_progress(result)
+
+    return result
+
+
+class ImportPlanner:
+    """
+    Decide, one chunk at a time, which rows become new students and, with
+    `upsert`, which existing students change.
+
+    Lookups against the unique columns are done with one query per chunk and
+    kept in sets for the whole file, so rows repeating a matricule or numero
+    seen earlier in the file are caught even when nothing was written yet.
+    """
+
+    def __init__(self, result, clean, create_issuers=True, upsert=False):
+        self.result = result
+        self.clean = clean
+        self.create_issuers = create_issuers
+        self.upsert = upsert
+        self.seen_matricules = set()
+        self.seen_numeros = set()
+        self.issuers = {}
+        self.ambiguous_issuers = {}
+        # (issuer_id, session) of updated students before their changes
+        self.previous_slices = set()
+
+    def plan(self, chunk):
+        """
+        Return the rows to insert as (row_number, data), data['issuer'] being
+        set, and the students to update as (row_number, student, changed_fields)
+        """
+        result = self.result
+        cleaned = []
+        for row_number, row in chunk:
+            try:
+                cleaned.append((row_number, self.clean(row)))
+            except Exception as e:
+                result.add_error(row_number, str(e))
+
+        self._load(cleaned)
+
+        inserts = []
+        updates = []
+        for row_number, data in cleaned:
+            matricule = data['matricule']
+            if not matricule:
+                result.add_error(row_number, "Missing matricule")
+                continue
+
+            existing = self.existing.get(matricule)
+            if existing is not None and not self.upsert:
+                if _identity(existing) == _identity(data):
+                    result.add_skip(row_number, f"Matricule {matricule} is already imported")
+                else:
+                    result.add_skip(row_number, f"Matricule {matricule} already belongs to another student")
+                continue
+
+            if matricule in self.seen_matricules:
+                result.add_skip(row_number, f"Matricule {matricule} appears earlier in the file")
+                continue
+
+            issuer_name = data['issuer_name_en']
+            if not issuer_name:
+                result.add_error(row_number, "Missing issuer name")
+                continue
+
+            if issuer_name in self.ambiguous_issuers:
+                result.add_error(
+                    row_number,
+                    f"get() returned more than one Issuer -- it returned {self.ambiguous_issuers[issuer_name]}!"
+                )
+                continue
+
+            if issuer_name not in self.issuers:
+                self.issuers[issuer_name] = (
+                    Issuer.objects.create(name_en=issuer_name) if self.create_issuers else None
+                )
+
+            own_numero = existing.numero if existing is not None else None
+            if data['numero'] in self.seen_numeros and data['numero'] != own_numero:
+                result.add_error(row_number, f"Duplicate numero {data['numero']}")
+                continue
+
+            self.seen_matricules.add(matricule)
+            self.seen_numeros.add(data['numero'])
+            data['issuer'] = self.issuers[issuer_name]
+            if existing is None:
+                inserts.append((row_number, data))
+                continue
+
+            previous_slice = (existing.issuer_id, existing.session or '')
+            changed = _apply_changes(existing, data)
+            if changed:
+                self.previous_slices.add(previous_slice)
+                updates.append((row_number, existing, changed))
+            else:
+                result.add_skip(row_number, f"Matricule {matricule} is unchanged")
+
+        return inserts, updates
+
+    def _load(self, cleaned):
+        matricules = {data['matricule'] for _, data in cleaned if data['matricule']}
+        numeros = {data['numero'] for _, data in cleaned}
+        issuer_names = {data['issuer_name_en'] for _, data in cleaned if data['issuer_name_en']}
+        issuer_names -= self.issuers.keys()
+
+        # matricule is unique, so its row also answers the unique_together check
+        self.existing = {
+            student.matricule: student
+            for student in Student.objects.filter(matricule__in=matricules).only(
+                *UPSERT_FIELDS, 'issuer', 'qr_code_link', 'qr_fingerprint'
+            )
+        }
+        self.seen_numeros.update(
+            Student.objects.filter(numero__in=numeros).values_list('numero', flat=True)
+        )
+        for issuer in Issuer.objects.filter(name_en__in=issuer_names):
+            if issuer.name_en in self.issuers:
+                self.ambiguous_issuers[issuer.name_en] = self.ambiguous_issuers.get(issuer.name_en, 1) + 1
+            self.issuers[issuer.name_en] = issuer
+
+
+# Student.Meta.unique_together
+IDENTITY_FIELDS = ['noms_et_prenoms', 'matricule', 'filiere', 'session']
+
+# Columns an upsert compares and rewrites, besides the issuer
+UPSERT_FIELDS = STUDENT_FIELDS + ['date_de_naissance']
+
+
+def _identity(record):
+    if isinstance(record, dict):
+        return tuple(record[field] or '' for field in IDENTITY_FIELDS)
+    return tuple(getattr(record, field) or '' for field in IDENTITY_FIELDS)
+
+
+def _apply_changes(student, data):
+    """Copy the differing values of `data` onto `student`, return the changed field names"""
+    changed = []
+    for field in UPSERT_FIELDS:
+        current = getattr(student, field)
+        if isinstance(current, date):
+            current = current.isoformat()
+        # Blank columns may hold NULL or '' depending on how the row was created
+        if (current or '') != (data[field] or ''):
+            setattr(student, field, data[field])
+            changed.append(field)
+    issuer = data['issuer']
+    if issuer is None or issuer.pk != student.issuer_id:
+        if issuer is not None:
+            student.issuer = issuer
+        changed.append('issuer')
+    return changed
+
+
+def _insert_students(planned, result, batch_size, renderer):
+    if not planned:
+        return
+
+    students = []
+    for _, data in planned:
+        fields = {field: data[field] for field in UPSERT_FIELDS + ['issuer']}
+        students.append(Student(**fields))
+
+    Student.objects.bulk_create(students, batch_size=batch_size)
+    if any(student.pk is None for student in students):
+        # Backends that cannot return primary keys from bulk inserts
+        ids = dict(
+            Student.objects.filter(
+                matricule__in=[student.matricule for student in students]
+            ).values_list('matricule', 'id')
+        )
+        for student in students:
+            student.pk = ids[student.matricule]
+
+    renderer.preload(student.pk for student in students)
+    linked = []
+    for (row_number, _), student in zip(planned, students):
+        try:
+            student.qr_code_link = renderer.link(student.pk)
+        except Exception as e:
+            result.add_error(row_number, str(e))
+            continue
+        student.qr_fingerprint = renderer.fingerprint
+        linked.append(student)
+        result.add_success(row_number)
+
+    Student.objects.bulk_update(linked, ['qr_code_link', 'qr_fingerprint'], batch_size=batch_size)
+
+
+def _update_students(updates, result, batch_size, renderer):
+    if not updates:
+        return
+
+    # One UPDATE per distinct set of changed columns, usually very few
+    by_fields = {}
+    for _, student, changed in updates:
+        by_fields.setdefault(tuple(changed), []).append(student)
+    for fields, students in by_fields.items():
+        Student.objects.bulk_update(students, list(fields), batch_size=batch_size)
+    # Before the new tokens are signed; printed codes still carry the previous values
+    expired = [student.pk for _, student, changed in updates if QR_FIELDS.intersection(changed)]
+    if expired:
+        expire_student_tokens(Student.objects.filter(id__in=expired))
+
+    renderer.preload(student.pk for _, student, _ in updates)
+    relinked = []
+    for row_number, student, changed in updates:
+        if student.qr_code_link and student.qr_fingerprint == renderer.fingerprint and not QR_FIELDS.intersection(changed):
+            result.add_update(row_number, f"Updated {', '.join(changed)}")
+            continue
+        try:
+            student.qr_code_link = renderer.link(student.pk)
+        except Exception as e:
+            result.add_error(row_number, str(e))
+            continue
+        student.qr_fingerprint = renderer.fingerprint
+        relinked.append(student)
+        result.add_update(row_number, f"Updated {', '.join(changed)}")
+
+    Student.objects.bulk_update(relinked, ['qr_code_link', 'qr_fingerprint'], batch_size=batch_size)
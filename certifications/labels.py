@@ -0,0 +1,232 @@
+"""
+Printable sheets of QR code labels, written as a PDF one page at a time.
+
+reportlab keeps every page in memory until the document is saved, so label
+sheets use this small PDF writer instead: each page is sent as soon as it
+is drawn, and the page tree and cross-reference table, which only need the
+object numbers and offsets, close the file. QR codes are drawn as vector
+rectangles from the qrcode matrix, labels use the bundled Almarai font
+(Latin and Arabic), embedded once per document as a subset of the glyphs
+used, with a ToUnicode map so the names can be searched and copied.
+"""
+import hashlib
+import zlib
+from django.conf import settings
+from reportlab.lib.pagesizes import A3, A4, LEGAL, LETTER
+from reportlab.pdfbase.ttfonts import TTFontFile
+from certifications.fonts import FONT_FACES, shape_text
+from certifications.importer import chunked
+from certifications.qr import QRRenderer
+
+LABEL_PAGE_SIZES = {'A4': A4, 'A3': A3, 'letter': LETTER, 'legal': LEGAL}
+
+# Page margin and space between the QR code and the cell edges, in points
+LABEL_MARGIN = 18
+LABEL_PADDING = 4
+
+LABEL_FONT = 'Almarai'
+
+# Objects written when the document is closed, numbered first so pages can refer to them
+CATALOG, PAGES, FONT, CID_FONT, FONT_DESCRIPTOR, FONT_FILE, TO_UNICODE, CID_TO_GID_MAP = range(1, 9)
+
+# Mappings per beginbfchar block of the ToUnicode CMap, the most PDF allows
+CMAP_BLOCK_SIZE = 100
+
+
+def _number(value):
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
+
+
+class LabelSheetWriter:
+    """
+    Write a PDF of label pages incrementally.
+
+    begin(), page() and end() return the bytes to send next. Text is shown
+    with an Identity-H encoded TrueType font whose CIDs are the glyph ids of
+    the full font, so pages can be written before the glyphs of later pages
+    are known. end() embeds a subset holding only the glyphs used, with a
+    CIDToGIDMap into it, their widths and their Unicode values.
+    """
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+        self.font_path = settings.BASE_DIR / 'static' / FONT_FACES[LABEL_FONT]
+        self.font = TTFontFile(str(self.font_path))
+        # glyph id: (width, character) of every glyph shown
+        self.used_glyphs = {}
+        self.offset = 0
+        self.offsets = {}
+        self.page_numbers = []
+        self.next_number = CID_TO_GID_MAP + 1
+
+    def _object(self, number, body):
+        self.offsets[number] = self.offset
+        data = f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+        self.offset += len(data)
+        return data
+
+    def _stream(self, number, data, extra=''):
+        compressed = zlib.compress(data)
+        header = f'<< /Length {len(compressed)} /Filter /FlateDecode {extra}>>\nstream\n'.encode()
+        return self._object(number, header + compressed + b'\nendstream')
+
+    def begin(self):
+        data = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.offset = len(data)
+        return data
+
+    def text_width(self, text, size):
+        widths = self.font.charWidths
+        return sum(widths.get(ord(char), self.font.defaultWidth) for char in text) * size / 1000
+
+    def encode_text(self, text):
+        """Hex string of the glyph ids of `text`, recording their widths and characters"""
+        glyphs = []
+        for char in text:
+            glyph = self.font.charToGlyph.get(ord(char), 0)
+            if glyph not in self.used_glyphs:
+                self.used_glyphs[glyph] = (self.font.charWidths.get(ord(char), self.font.defaultWidth), char)
+            glyphs.append(f'{glyph:04X}')
+        return '<' + ''.join(glyphs) + '>'
+
+    def page(self, content):
+        """Bytes of a page whose content stream is `content`"""
+        content_number = self.next_number
+        page_number = self.next_number + 1
+        self.next_number += 2
+        self.page_numbers.append(page_number)
+        width, height = self.page_size
+        page = (
+            f'<< /Type /Page /Parent {PAGES} 0 R /MediaBox [0 0 {_number(width)} {_number(height)}] '
+            f'/Resources << /Font << /F1 {FONT} 0 R >> >> /Contents {content_number} 0 R >>'
+        )
+        return self._stream(content_number, content.encode('latin-1')) + self._object(page_number, page.encode())
+
+    def end(self):
+        """Fonts, page tree, catalog and cross-reference table"""
+        font = self.font
+        font_name = font.name.decode('latin-1') if isinstance(font.name, bytes) else font.name
+        used = sorted(self.used_glyphs.items())
+        widths = ' '.join(f'{glyph} [{width}]' for glyph, (width, _) in used)
+        # makeSubset numbers glyphs in the order of the characters given, after .notdef
+        font_data = font.makeSubset([ord(char) for glyph, (_, char) in used if glyph != 0])
+        subset_glyphs = {0: 0}
+        for glyph, _ in used:
+            subset_glyphs.setdefault(glyph, len(subset_glyphs))
+        cid_to_gid = bytearray(2 * (max(subset_glyphs) + 1))
+        for glyph, subset_glyph in subset_glyphs.items():
+            cid_to_gid[2 * glyph:2 * glyph + 2] = subset_glyph.to_bytes(2, 'big')
+        # Subset fonts are named with a tag of six capital letters
+        tag = ''.join(chr(ord('A') + byte % 26) for byte in hashlib.sha256(bytes(cid_to_gid)).digest()[:6])
+        font_name = f'{tag}+{font_name}'
+
+        data = self._object(FONT, (
+            f'<< /Type /Font /Subtype /Type0 /BaseFont /{font_name} /Encoding /Identity-H '
+            f'/DescendantFonts [{CID_FONT} 0 R] /ToUnicode {TO_UNICODE} 0 R >>'
+        ).encode())
+        data += self._object(CID_FONT, (
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{font_name} '
+            f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+            f'/FontDescriptor {FONT_DESCRIPTOR} 0 R /DW {font.defaultWidth} /W [{widths}] '
+            f'/CIDToGIDMap {CID_TO_GID_MAP} 0 R >>'
+        ).encode())
+        data += self._object(FONT_DESCRIPTOR, (
+            f'<< /Type /FontDescriptor /FontName /{font_name} /Flags {font.flags} '
+            f"/FontBBox [{' '.join(str(value) for value in font.bbox)}] /ItalicAngle {font.italicAngle} "
+            f'/Ascent {font.ascent} /Descent {font.descent} /CapHeight {font.capHeight} /StemV {font.stemV} '
+            f'/FontFile2 {FONT_FILE} 0 R >>'
+        ).encode())
+        data += self._stream(FONT_FILE, font_data, f'/Length1 {len(font_data)} ')
+        data += self._stream(TO_UNICODE, self._to_unicode(used).encode())
+        data += self._stream(CID_TO_GID_MAP, bytes(cid_to_gid))
+        kids = ' '.join(f'{number} 0 R' for number in self.page_numbers)
+        data += self._object(PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_numbers)} >>'.encode())
+        data += self._object(CATALOG, f'<< /Type /Catalog /Pages {PAGES} 0 R >>'.encode())
+
+        xref_offset = self.offset
+        count = self.next_number
+        xref = [f'xref\n0 {count}\n', '0000000000 65535 f \n']
+        xref += [f'{self.offsets[number]:010d} 00000 n \n' for number in range(1, count)]
+        xref.append(f'trailer\n<< /Size {count} /Root {CATALOG} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+        return data + ''.join(xref).encode()
+
+    def _to_unicode(self, used):
+        """ToUnicode CMap of the glyphs shown, from glyph id to the character it was drawn for"""
+        mappings = [
+            f"<{glyph:04X}> <{char.encode('utf-16-be').hex().upper()}>" for glyph, (_, char) in used if glyph != 0
+        ]
+        lines = [
+            '/CIDInit /ProcSet findresource begin', '12 dict begin', 'begincmap',
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def',
+            '/CMapName /Adobe-Identity-UCS def', '/CMapType 2 def',
+            '1 begincodespacerange', '<0000> <FFFF>', 'endcodespacerange',
+        ]
+        for start in range(0, len(mappings), CMAP_BLOCK_SIZE):
+            block = mappings[start:start + CMAP_BLOCK_SIZE]
+            lines += [f'{len(block)} beginbfchar'] + block + ['endbfchar']
+        lines += ['endcmap', 'CMapName currentdict /CMap defineresource pop', 'end', 'end']
+        return '\n'.join(lines)
+
+
+def iter_label_sheets(students, columns=3, rows=8, page_size='A4', qr_renderer=None):
+    """
+    Yield a PDF of QR labels, `columns` x `rows` per page, each with the
+    student's name and numero under the code. Pages are yielded as they are
+    drawn, the QR codes of a page being prepared together.
+    """
+    renderer = qr_renderer or QRRenderer()
+    writer = LabelSheetWriter(LABEL_PAGE_SIZES[page_size])
+    width, height = writer.page_size
+    cell_width = (width - 2 * LABEL_MARGIN) / columns
+    cell_height = (height - 2 * LABEL_MARGIN) / rows
+    font_size = max(4, min(9, cell_height * 0.07))
+    text_height = font_size * 2.4
+    qr_size = max(min(cell_width, cell_height - text_height) - 2 * LABEL_PADDING, 1)
+    fill = ' '.join(_number(channel / 255) for channel in renderer.fill_color[:3])
+    back = ' '.join(_number(channel / 255) for channel in renderer.back_color[:3])
+
+    yield writer.begin()
+    records = students.values_list('id', 'noms_et_prenoms', 'numero').iterator(chunk_size=2000)
+    for page_students in chunked(records, columns * rows):
+        renderer.preload(student_id for student_id, _, _ in page_students)
+        content = []
+        for cell, (student_id, name, numero) in enumerate(page_students):
+            column, row = cell % columns, cell // columns
+            x = LABEL_MARGIN + column * cell_width
+            top = height - LABEL_MARGIN - row * cell_height
+
+            matrix = renderer.matrix(student_id)
+            module = qr_size / len(matrix)
+            qr_x = x + (cell_width - qr_size) / 2
+            qr_y = top - LABEL_PADDING - qr_size
+            # Draw in module units: each dark run is one short "x y w 1 re"
+            content.append(f'q {back} rg {_number(qr_x)} {_number(qr_y)} {_number(qr_size)} {_number(qr_size)} re f')
+            content.append(f'{_number(module)} 0 0 {_number(module)} {_number(qr_x)} {_number(qr_y)} cm {fill} rg')
+            size = len(matrix)
+            for row_index, modules in enumerate(matrix):
+                start = None
+                for column_index, dark in enumerate(modules + [False]):
+                    if dark and start is None:
+                        start = column_index
+                    elif not dark and start is not None:
+                        content.append(f'{start} {size - 1 - row_index} {column_index - start} 1 re')
+                        start = None
+            content.append('f Q 0 g')
+
+            text_y = qr_y - font_size * 1.1
+            for text in (name or '', numero or ''):
+                shaped, _ = shape_text(text)
+                line_size = font_size
+                text_width = writer.text_width(shaped, line_size)
+                if text_width > cell_width - 2 * LABEL_PADDING:
+                    # Shrink long names to the cell
+                    line_size = font_size * (cell_width - 2 * LABEL_PADDING) / text_width
+                    text_width = writer.text_width(shaped, line_size)
+                text_x = x + (cell_width - text_width) / 2
+                content.append(
+                    f'BT /F1 {_number(line_size)} Tf {_number(text_x)} {_number(text_y)} Td {writer.encode_text(shaped)} Tj ET'
+                )
+                text_y -= font_size * 1.2
+
+        yield writer.page('\n'.join(content))
+    yield writer.end()
@@ -0,0 +1,47 @@
+import csv
+import io
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from openpyxl import Workbook
+from certifications.importer import clean_row, iter_csv_rows
+from certifications.xlsx import check_normalised_row, iter_xlsx_records
+
+HEADER = ['noms_et_prenoms', 'matricule', 'filiere', 'mention', 'session', 'sexe', 'date_de_naissance', 'lieu_de_naissance', 'numero', 'issuer_name_en']
+
+class Command(BaseCommand):
+    help = 'Compares parsing and normalisation throughput of the CSV and XLSX import paths (no database writes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='Number of synthetic rows')
+
+    def handle(self, *args, **options):
+        rows = [
+            [f'Student {i}', f'MAT{i}', 'Informatique', 'Bien', '2024', 'MF'[i % 2],
+             f'{i % 28 + 1:02d}/01/2000' if i % 3 else '2000-01-15', 'Douala', f'NUM{i}', 'University of Example']
+            for i in range(options['rows'])
+        ]
+
+        with tempfile.TemporaryFile() as csv_file, tempfile.TemporaryFile() as xlsx_file:
+            text = io.TextIOWrapper(csv_file, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+            text.flush()
+            text.detach()
+
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(HEADER)
+            for row in rows:
+                sheet.append(row)
+            workbook.save(xlsx_file)
+
+            self._report('CSV row loop', lambda: (clean_row(row) for row in iter_csv_rows(csv_file)))
+            self._report('XLSX columnar', lambda: (check_normalised_row(row) for row in iter_xlsx_records(xlsx_file)))
+
+    def _report(self, label, records):
+        start = time.perf_counter()
+        count = sum(1 for _ in records())
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{label}: {count} rows in {elapsed:.2f}s ({count / elapsed:,.0f} rows/s)')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from certifications.exports import build_qr_archive, cached_qr_archive
+from certifications.models import Student
+from certifications.qr import QRRenderer
+
+class Command(BaseCommand):
+    help = 'Pre-builds the QR code export archive of every issuer and of each of its sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issuer', type=int, help='Only this issuer id')
+        parser.add_argument('--force', action='store_true', help='Also rebuild archives that are up to date')
+
+    def handle(self, *args, **options):
+        students = Student.objects.all()
+        if options['issuer']:
+            students = students.filter(issuer_id=options['issuer'])
+        slices = set()
+        for issuer_id, session in students.values_list('issuer_id', 'session').distinct().iterator():
+            slices.add((issuer_id, ''))
+            if session:
+                slices.add((issuer_id, session))
+
+        renderer = QRRenderer()
+        built = 0
+        for issuer_id, session in sorted(slices):
+            if not options['force'] and cached_qr_archive(issuer_id, session, renderer) is not None:
+                continue
+            archive = build_qr_archive(issuer_id, session)
+            if archive is None:
+                self.stdout.write(self.style.WARNING(f'Issuer {issuer_id} {session or "all sessions"}: students changed during the build, skipped'))
+                continue
+            built += 1
+            self.stdout.write(f'Issuer {issuer_id} {session or "all sessions"}: {archive.student_count} students')
+
+        self.stdout.write(self.style.SUCCESS(f'Built {built} of {len(slices)} archives'))
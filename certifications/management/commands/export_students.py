@@ -0,0 +1,29 @@
+import sys
+from django.core.management.base import BaseCommand
+from certifications.exports import STUDENT_EXPORT_FORMATS, filter_students, student_export
+
+class Command(BaseCommand):
+    help = 'Exports student data as CSV, JSONL or XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(STUDENT_EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', default='-', help='File to write, - for standard output')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output (CSV and JSONL only)')
+        parser.add_argument('--issuer', type=int, help='Only students of this issuer id')
+        parser.add_argument('--session', default='', help='Only students of this session')
+        parser.add_argument('--filiere', default='', help='Only students of this filiere')
+
+    def handle(self, *args, **options):
+        students = filter_students(options['issuer'], options['session'], options['filiere'])
+        _, _, chunks = student_export(students, options['format'], gzip=options['gzip'])
+
+        if options['output'] == '-':
+            for data in chunks:
+                sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+            return
+
+        with open(options['output'], 'wb') as output:
+            for data in chunks:
+                output.write(data)
+        self.stderr.write(self.style.SUCCESS(f"Exported students to {options['output']}"))
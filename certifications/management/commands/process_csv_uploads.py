@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from certifications.models import CSVUpload
+from certifications.tasks import process_csv_upload
+
+class Command(BaseCommand):
+    help = 'Imports pending CSV uploads, optionally polling for new ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll for new uploads')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+        parser.add_argument('--resume', action='store_true', help='Also resume uploads interrupted mid-import (run once at startup)')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            interrupted = CSVUpload.objects.filter(processed=False, started_at__isnull=False).order_by('uploaded_at')
+            for upload_id in interrupted.values_list('id', flat=True):
+                self._report(process_csv_upload(upload_id, resume=True))
+
+        while True:
+            pending = CSVUpload.objects.filter(processed=False, started_at__isnull=True).order_by('uploaded_at')
+            for upload_id in pending.values_list('id', flat=True):
+                self._report(process_csv_upload(upload_id))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def _report(self, upload):
+        if upload is not None:
+            self.stdout.write(
+                f'Upload {upload.id}: {upload.successful_records} imported, '
+                f'{upload.skipped_records} skipped, {upload.failed_records} failed'
+            )
@@ -0,0 +1,35 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from certifications.models import Student
+from certifications.qr import QR_CODES_DIR, qr_code_path_from_link, qr_code_storage_path
+
+class Command(BaseCommand):
+    help = 'Deletes QR images that no student links to anymore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the files that would be deleted')
+
+    def handle(self, *args, **options):
+        links = Student.objects.exclude(qr_code_link__isnull=True).exclude(qr_code_link='')
+        referenced = {
+            qr_code_path_from_link(link)
+            for link in links.values_list('qr_code_link', flat=True).iterator()
+        }
+
+        try:
+            _, files = default_storage.listdir(QR_CODES_DIR)
+        except FileNotFoundError:
+            # Nothing was ever stored, e.g. when QR codes are rendered on demand
+            files = []
+        files = [name for name in files if name.endswith(('.png', '.svg'))]
+        deleted = 0
+        for name in files:
+            path = qr_code_storage_path(name)
+            if path in referenced:
+                continue
+            if not options['dry_run']:
+                default_storage.delete(path)
+            deleted += 1
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {deleted} of {len(files)} QR images'))
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from certifications.exports import filter_students
+from certifications.labels import LABEL_PAGE_SIZES, iter_label_sheets
+
+class Command(BaseCommand):
+    help = 'Writes printable sheets of QR code labels as a PDF'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='PDF file to write')
+        parser.add_argument('--columns', type=int, default=3, help='Labels per row')
+        parser.add_argument('--rows', type=int, default=8, help='Rows of labels per page')
+        parser.add_argument('--page-size', choices=sorted(LABEL_PAGE_SIZES), default='A4')
+        parser.add_argument('--issuer', type=int, help='Only students of this issuer id')
+        parser.add_argument('--session', default='', help='Only students of this session')
+        parser.add_argument('--filiere', default='', help='Only students of this filiere')
+
+    def handle(self, *args, **options):
+        students = filter_students(options['issuer'], options['session'], options['filiere'])
+        total = students.count()
+        started = time.monotonic()
+        with open(options['output'], 'wb') as output:
+            for data in iter_label_sheets(students, options['columns'], options['rows'], options['page_size']):
+                output.write(data)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {total} labels to {options['output']} in {elapsed:.1f}s ({total / elapsed:.0f} labels/s)"
+        ))
@@ -1,20 +1,49 @@
+import os
 from django.core.management.base import BaseCommand
+from django.db.models import Q
+from certifications.exports import invalidate_qr_archives
+from certifications.importer import chunked
 from certifications.models import Student
-from certifications.views import generate_qr_code
+from certifications.qr import QRRenderer, stale_students
+from certifications.verification import invalidate_verification_pages
+from certifications.workers import ProgressReporter, init_qr_worker, render_qr_batch, run_batches
+
 
 class Command(BaseCommand):
-    help = 'Regenerates QR codes for all students with the correct URL'
+    help = 'Regenerates the QR codes of students whose URL or QR settings changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Rendering processes (1 renders in this process)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Students rendered and written back per batch')
+        parser.add_argument('--only-missing', action='store_true', help='Only students without a QR code link')
+        parser.add_argument('--force', action='store_true', help='Also students whose QR code is up to date')
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, **options):
         students = Student.objects.all()
-        total = students.count()
+        if options['only_missing']:
+            students = students.filter(Q(qr_code_link__isnull=True) | Q(qr_code_link=''))
+        elif not options['force']:
+            students = stale_students(QRRenderer(), students)
+        # Read up front: SQLite does not isolate an open cursor from the
+        # batches written back through the same connection
+        student_ids = list(students.order_by('id').values_list('id', flat=True))
+        total = len(student_ids)
         self.stdout.write(f'Found {total} students. Starting QR code regeneration...')
 
-        for i, student in enumerate(students, 1):
-            # Generate new QR code
-            qr_code_url = generate_qr_code(student.id)
-            student.qr_code_link = qr_code_url
-            student.save()
-            self.stdout.write(f'Processed {i}/{total}: {student.noms_et_prenoms}')
+        batches = chunked(student_ids, options['batch_size'])
 
+        self.progress = ProgressReporter(self.stdout, total, 'Processed {done}/{total} ({rate:.0f} codes/s)')
+        run_batches(render_qr_batch, batches, options['workers'], init_qr_worker, self._save_batch)
+        self.progress.report(force=True)
+        if total:
+            invalidate_qr_archives()
         self.stdout.write(self.style.SUCCESS('Successfully regenerated all QR codes'))
+
+    def _save_batch(self, links):
+        students = [
+            Student(id=student_id, qr_code_link=link, qr_fingerprint=fingerprint)
+            for student_id, link, fingerprint in links
+        ]
+        Student.objects.bulk_update(students, ['qr_code_link', 'qr_fingerprint'])
+        invalidate_verification_pages(student_id for student_id, _, _ in links)
+        self.progress.add(len(students))
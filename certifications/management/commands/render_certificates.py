@@ -0,0 +1,35 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from certifications.exports import filter_students
+from certifications.importer import chunked
+from certifications.workers import ProgressReporter, init_certificate_worker, render_certificate_batch, run_batches
+
+
+class Command(BaseCommand):
+    help = 'Renders the certificate PDFs of students with their certificate template'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default=os.path.join(settings.MEDIA_ROOT, 'certificates'), help='Directory the PDFs are written to')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Rendering processes (1 renders in this process)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Students rendered per worker task')
+        parser.add_argument('--issuer', type=int, help='Only students of this issuer id')
+        parser.add_argument('--session', default='', help='Only students of this session')
+        parser.add_argument('--filiere', default='', help='Only students of this filiere')
+
+    def handle(self, *args, **options):
+        os.makedirs(options['output_dir'], exist_ok=True)
+        students = filter_students(options['issuer'], options['session'], options['filiere'])
+        total = students.count()
+        self.stdout.write(f"Rendering {total} certificates to {options['output_dir']}...")
+
+        student_ids = students.values_list('id', flat=True).iterator(chunk_size=options['batch_size'])
+        batches = chunked(student_ids, options['batch_size'])
+
+        progress = ProgressReporter(self.stdout, total, 'Rendered {done}/{total} ({rate:.1f} pages/s)')
+        run_batches(
+            render_certificate_batch, batches, options['workers'], init_certificate_worker, progress.add,
+            options['output_dir'],
+        )
+        progress.report(force=True)
+        self.stdout.write(self.style.SUCCESS(f'Rendered {progress.done} certificates'))
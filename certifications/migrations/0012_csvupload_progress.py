@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certifications', '0011_alter_student_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvupload',
+            name='processed_records',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='csvupload',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certifications', '0012_csvupload_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvupload',
+            name='dry_run',
+            field=models.BooleanField(default=False, verbose_name='Validate only'),
+        ),
+        migrations.AddField(
+            model_name='csvupload',
+            name='report',
+            field=models.FileField(blank=True, upload_to='uploads/reports/'),
+        ),
+    ]
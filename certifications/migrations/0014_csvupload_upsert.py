@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certifications', '0013_csvupload_dry_run_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvupload',
+            name='updated_records',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='csvupload',
+            name='upsert',
+            field=models.BooleanField(default=False, verbose_name='Update existing students'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certifications', '0014_csvupload_upsert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qrcodecustomization',
+            name='box_size',
+            field=models.PositiveSmallIntegerField(default=10, help_text='Pixels per QR module'),
+        ),
+        migrations.AddField(
+            model_name='qrcodecustomization',
+            name='output_format',
+            field=models.CharField(choices=[('png', 'PNG (palette, optimised)'), ('png_rgb', 'PNG (RGB)'), ('svg', 'SVG')], default='png', max_length=10),
+        ),
+    ]
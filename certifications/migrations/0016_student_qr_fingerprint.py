@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certifications', '0015_qrcodecustomization_output_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='qr_fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
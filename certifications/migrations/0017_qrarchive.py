@@ -0,0 +1,30 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certifications', '0016_student_qr_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QRArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session', models.CharField(blank=True, max_length=50)),
+                ('file', models.FileField(blank=True, upload_to='exports/qr/')),
+                ('fingerprint', models.CharField(blank=True, max_length=64)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('student_count', models.IntegerField(default=0)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+                ('issuer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='certifications.issuer')),
+            ],
+            options={
+                'unique_together': {('issuer', 'session')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certifications', '0019_student_issuer_recent_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvupload',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
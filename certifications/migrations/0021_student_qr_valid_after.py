@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certifications', '0020_csvupload_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='qr_valid_after',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -53,17 +53,33 @@ class Student(models.Model):
     issue_date = models.DateTimeField('Date de Délivrance', blank=True, null=True, auto_now_add=True)
     template = models.ForeignKey(CertificateTemplate, on_delete=models.SET_NULL, null=True, blank=True)
     qr_code_link = models.URLField('Lien QR Code', max_length=255, unique=True, blank=True, null=True)
+    # QRRenderer.fingerprint of the settings qr_code_link was produced with
+    qr_fingerprint = models.CharField(max_length=64, blank=True, default='', editable=False)
+    # Signed QR codes issued before this time carry outdated fields and no longer verify
+    qr_valid_after = models.DateTimeField(blank=True, null=True, editable=False)
 
     class Meta:
         unique_together = ['noms_et_prenoms', 'matricule', 'filiere', 'session']
+        indexes = [
+            # Keyset pagination of the public issuer page
+            models.Index(fields=['issuer', '-issue_date', '-id'], name='student_issuer_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.noms_et_prenoms or ''} | {self.matricule or ''}"
 
 class QRCodeCustomization(models.Model):
+    OUTPUT_FORMAT_CHOICES = [
+        ('png', 'PNG (palette, optimised)'),
+        ('png_rgb', 'PNG (RGB)'),
+        ('svg', 'SVG'),
+    ]
+
     logo = models.ImageField(upload_to='qr_logos', blank=True, null=True)
     foreground_color = models.CharField(max_length=7, default='#000000')
     background_color = models.CharField(max_length=7, default='#FFFFFF')
+    output_format = models.CharField(max_length=10, choices=OUTPUT_FORMAT_CHOICES, default='png')
+    box_size = models.PositiveSmallIntegerField(default=10, help_text='Pixels per QR module')
 
     def __str__(self):
         return f"QR Code Customization {self.id}"
@@ -77,15 +93,55 @@ class SampleCSV(models.Model):
 
 class CSVUpload(models.Model):
     file = models.FileField(upload_to='uploads/csv/')
+    dry_run = models.BooleanField('Validate only', default=False)
+    upsert = models.BooleanField('Update existing students', default=False)
+    report = models.FileField(upload_to='uploads/reports/', blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the importing worker after every chunk, cleared when it stops
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
     processed = models.BooleanField(default=False)
     total_records = models.IntegerField(default=0)
+    processed_records = models.IntegerField(default=0)
     successful_records = models.IntegerField(default=0)
+    updated_records = models.IntegerField(default=0)
     failed_records = models.IntegerField(default=0)
     error_log = models.TextField(blank=True)
 
     def __str__(self):
         return f"CSV Upload {self.id} - {self.uploaded_at}"
 
+    @property
+    def skipped_records(self):
+        return self.processed_records - self.successful_records - self.updated_records - self.failed_records
+
     class Meta:
         ordering = ['-uploaded_at']
+
+class QRArchive(models.Model):
+    """Pre-built QR code export of one issuer, for one session or all of them (blank session)"""
+    issuer = models.ForeignKey(Issuer, on_delete=models.CASCADE)
+    session = models.CharField(max_length=50, blank=True)
+    file = models.FileField(upload_to='exports/qr/', blank=True)
+    # QRRenderer.fingerprint the images were rendered with
+    fingerprint = models.CharField(max_length=64, blank=True)
+    # Bumped whenever a student of the slice changes, so a build that overlaps
+    # the change is discarded
+    version = models.PositiveIntegerField(default=0)
+    student_count = models.IntegerField(default=0)
+    built_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"QR Archive {self.issuer} {self.session or 'all sessions'}"
+
+    class Meta:
+        unique_together = ['issuer', 'session']
+
+class RevokedCertificate(models.Model):
+    """Student whose signed QR codes no longer verify; the student row may be gone"""
+    student_id = models.BigIntegerField(unique=True)
+    reason = models.CharField(max_length=200, blank=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Revoked certificate of student {self.student_id}"
@@ -0,0 +1,305 @@
+import base64
+import hashlib
+import io
+from functools import lru_cache
+import qrcode
+from qrcode.compat.etree import ET
+from qrcode.image.svg import SvgPathImage
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.urls import reverse
+from certifications.models import QRCodeCustomization, Student
+from certifications.tokens import QR_SIGNED_PAYLOADS, QR_TOKEN_FIELDS, qr_tokens
+from PIL import Image, ImageColor
+
+# Student fields encoded in the QR code. Unsigned codes only hold the student
+# URL, so changing any of the imported columns keeps the existing image valid;
+# signed codes carry the certificate fields (see certifications.tokens).
+QR_FIELDS = QR_TOKEN_FIELDS if QR_SIGNED_PAYLOADS else frozenset()
+
+# Bump when the rendering code changes so new images get new file names
+QR_RENDER_VERSION = 1
+
+QR_CODES_DIR = 'qr_codes'
+
+QR_BORDER = 4
+
+QR_CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Served by the qr_image view, file names never change content
+QR_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Served by the student_qr_image view, revalidated with the ETag once stale
+QR_ON_DEMAND_CACHE_CONTROL = 'public, max-age=3600'
+
+# Store a PNG per student at import time instead of linking to the on-demand view
+QR_PRERENDER_IMAGES = getattr(settings, 'QR_PRERENDER_IMAGES', False)
+
+# Renders kept in memory per process by the on-demand view
+QR_RENDER_CACHE_SIZE = getattr(settings, 'QR_RENDER_CACHE_SIZE', 1024)
+
+class QRRenderer:
+    """
+    Render student QR codes for a batch of students.
+
+    The customization row is read once, the logo is decoded once and kept
+    resized per QR image size, so rendering many codes costs a single query
+    and a single logo decode.
+
+    Images are stored under a hash of everything that goes into them (URL,
+    colours, logo bytes, format, size parameters), so a render whose file
+    already exists is skipped and an image URL always designates the same bytes.
+
+    The QR version only depends on the URL length, so it is looked up once per
+    length instead of letting qrcode search for it on every render.
+
+    With signed payloads the URL holds a token built from the student's row;
+    batch callers preload() the tokens of a batch in one query, other
+    students cost a query each.
+    """
+
+    def __init__(self, customization=None):
+        if customization is None:
+            customization = QRCodeCustomization.objects.first()
+            if not customization:
+                customization = QRCodeCustomization.objects.create()
+        self.customization = customization
+        self.fill_color = ImageColor.getrgb(customization.foreground_color)
+        self.back_color = ImageColor.getrgb(customization.background_color)
+        self.output_format = customization.output_format
+        self.extension = 'svg' if self.output_format == 'svg' else 'png'
+        self.content_type = QR_CONTENT_TYPES[self.extension]
+        self.box_size = customization.box_size
+        self._versions = {}
+        self._tokens = {}
+
+        self.logo = None
+        self._logo_data_uri = None
+        self._resized_logos = {}
+        logo_digest = ''
+        if customization.logo:
+            with open(customization.logo.path, 'rb') as logo_file:
+                logo_bytes = logo_file.read()
+            logo_digest = hashlib.sha256(logo_bytes).hexdigest()
+            with Image.open(io.BytesIO(logo_bytes)) as logo:
+                self.logo = logo.convert('RGBA')
+            if self.output_format == 'svg':
+                logo_buffer = io.BytesIO()
+                self.logo.save(logo_buffer, format='PNG', optimize=True)
+                self._logo_data_uri = 'data:image/png;base64,' + base64.b64encode(logo_buffer.getvalue()).decode()
+        self._digest_prefix = '|'.join([
+            str(QR_RENDER_VERSION),
+            customization.foreground_color.lower(),
+            customization.background_color.lower(),
+            logo_digest,
+            f'format={self.output_format}', f'box_size={self.box_size}', f'border={QR_BORDER}',
+            'error_correction=L',
+        ])
+        if self.output_format == 'svg':
+            # SVG factory drawing every module in one path with our colours
+            self._svg_factory = type('QRSvgImage', (SvgPathImage,), {
+                'background': customization.background_color,
+                'QR_PATH_STYLE': {**SvgPathImage.QR_PATH_STYLE, 'fill': customization.foreground_color},
+            })
+
+        # reverse() once, student ids (or tokens) are formatted into the resulting path
+        placeholder = 999999999
+        if QR_SIGNED_PAYLOADS:
+            relative_url = reverse('certifications:verify_token', args=[placeholder])
+        else:
+            relative_url = reverse('certifications:student_qr_info', args=[placeholder])
+        self._url_template = f"{settings.BASE_URL.rstrip('/')}{relative_url}".replace(str(placeholder), '{}')
+        image_url = reverse('certifications:qr_image', kwargs={'digest': '0' * 64, 'extension': self.extension})
+        self._image_url_template = f"{settings.BASE_URL.rstrip('/')}{image_url}".replace('0' * 64, '{}')
+        on_demand_url = reverse('certifications:student_qr_image', kwargs={'student_id': placeholder, 'extension': self.extension})
+        self._on_demand_url_template = f"{settings.BASE_URL.rstrip('/')}{on_demand_url}".replace(str(placeholder), '{}')
+
+        # Identifies everything a student's link and image are derived from
+        # except the student id, so up-to-date students are found in one query
+        link_template = self._image_url_template if QR_PRERENDER_IMAGES else self._on_demand_url_template
+        self.fingerprint = hashlib.sha256(
+            '|'.join([self._digest_prefix, self._url_template, link_template]).encode()
+        ).hexdigest()
+
+        # Recent renders by QR content, dropped with the renderer when the customization changes
+        self._render_data_cached = lru_cache(maxsize=QR_RENDER_CACHE_SIZE)(self._render_data)
+
+    def preload(self, student_ids):
+        """Build the signed tokens of a batch of students at once, replacing the previous batch"""
+        if QR_SIGNED_PAYLOADS:
+            self._tokens = qr_tokens(student_ids)
+
+    def student_url(self, student_id):
+        """Content of a student's QR code"""
+        if not QR_SIGNED_PAYLOADS:
+            return self._url_template.format(student_id)
+        token = self._tokens.get(student_id) or qr_tokens([student_id]).get(student_id)
+        if token is None:
+            raise Student.DoesNotExist(f'Student {student_id} does not exist')
+        return self._url_template.format(token)
+
+    def digest(self, student_id):
+        """Hash of the render inputs, used as the image file name"""
+        return self.content_digest(self.student_url(student_id))
+
+    def content_digest(self, data):
+        """digest() of a QR content returned by student_url()"""
+        key = f'{self._digest_prefix}|{data}'
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _logo_for(self, size):
+        logo = self._resized_logos.get(size)
+        if logo is None:
+            logo = self.logo.resize((size[0] // 4, size[1] // 4), Image.LANCZOS)
+            self._resized_logos[size] = logo
+        return logo
+
+    def _version_for(self, data):
+        version = self._versions.get(len(data))
+        if version is None:
+            qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L)
+            qr.add_data(data)
+            version = self._versions[len(data)] = qr.best_fit()
+        return version
+
+    def matrix(self, student_id):
+        """Modules of a student's QR code, border included, as rows of booleans (True is dark)"""
+        data = self.student_url(student_id)
+        qr = qrcode.QRCode(
+            version=self._version_for(data),
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            border=QR_BORDER,
+        )
+        qr.add_data(data)
+        qr.make(fit=False)
+        return qr.get_matrix()
+
+    def render(self, student_id):
+        """Return the image bytes of a student's QR code, in the customization's format"""
+        return self._render_data(self.student_url(student_id))
+
+    def render_cached(self, data):
+        """Image bytes of a QR content returned by student_url(), through the in-memory cache of recent renders"""
+        return self._render_data_cached(data)
+
+    def _render_data(self, data):
+        qr = qrcode.QRCode(
+            version=self._version_for(data),
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=self.box_size,
+            border=QR_BORDER,
+        )
+        qr.add_data(data)
+        qr.make(fit=False)
+
+        if self.output_format == 'svg':
+            return self._render_svg(qr)
+
+        if self.output_format == 'png' and self.logo is None:
+            # Two colours: a 1-bit paletted image
+            qr_img = qr.make_image().get_image().convert('L').point(lambda value: value // 255).convert('P')
+            qr_img.putpalette(self.fill_color + self.back_color)
+        else:
+            qr_img = qr.make_image(fill_color=self.fill_color, back_color=self.back_color).get_image().convert('RGB')
+            if self.logo is not None:
+                logo = self._logo_for(qr_img.size)
+                pos = ((qr_img.size[0] - logo.size[0]) // 2, (qr_img.size[1] - logo.size[1]) // 2)
+                qr_img.paste(logo, pos, logo)
+            if self.output_format == 'png':
+                qr_img = qr_img.quantize()
+
+        qr_buffer = io.BytesIO()
+        qr_img.save(qr_buffer, format="PNG", optimize=True)
+        return qr_buffer.getvalue()
+
+    def _render_svg(self, qr):
+        qr_img = qr.make_image(image_factory=self._svg_factory)
+        if self._logo_data_uri is not None:
+            size = qr_img.units(qr_img.pixel_size, text=False)
+            logo_size = size / 4
+            qr_img._img.append(ET.Element(
+                'image',
+                href=self._logo_data_uri,
+                x=str((size - logo_size) / 2),
+                y=str((size - logo_size) / 2),
+                width=str(logo_size),
+                height=str(logo_size),
+            ))
+        qr_buffer = io.BytesIO()
+        qr_img.save(qr_buffer)
+        return qr_buffer.getvalue()
+
+    def save(self, student_id):
+        """Store a student's QR code unless an identical render exists, return its URL"""
+        digest = self.digest(student_id)
+        qr_code_path = qr_code_storage_path(digest, self.extension)
+        if not default_storage.exists(qr_code_path):
+            saved_path = default_storage.save(qr_code_path, ContentFile(self.render(student_id)))
+            if saved_path != qr_code_path:
+                # Another worker stored the same render in the meantime
+                default_storage.delete(saved_path)
+
+        # Return the full URL for the QR code
+        return self._image_url_template.format(digest)
+
+    def link(self, student_id):
+        """URL stored in qr_code_link, rendering the image only when pre-rendering is enabled"""
+        if QR_PRERENDER_IMAGES:
+            return self.save(student_id)
+        return self._on_demand_url_template.format(student_id)
+
+
+def stale_students(renderer, students=None):
+    """Students whose QR code link is missing or was produced with other settings"""
+    if students is None:
+        students = Student.objects.all()
+    return students.filter(
+        Q(qr_code_link__isnull=True) | Q(qr_code_link='') | ~Q(qr_fingerprint=renderer.fingerprint)
+    )
+
+
+def _customization_key(customization):
+    return (
+        customization.pk, customization.foreground_color, customization.background_color, customization.logo.name,
+        customization.output_format, customization.box_size,
+    )
+
+
+_shared_renderer = None
+
+
+def shared_renderer():
+    """
+    Process-wide renderer for request handling.
+
+    Costs one query per call to notice customization changes made by other
+    processes; the renderer, its decoded logo and its render cache are only
+    rebuilt when the customization actually changed.
+    """
+    global _shared_renderer
+    customization = QRCodeCustomization.objects.first()
+    if not customization:
+        customization = QRCodeCustomization.objects.create()
+    renderer = _shared_renderer
+    if renderer is None or _customization_key(renderer.customization) != _customization_key(customization):
+        renderer = _shared_renderer = QRRenderer(customization)
+    return renderer
+
+
+def qr_code_storage_path(name, extension='png'):
+    """Storage path of a QR image from its digest or file name"""
+    if '.' not in name:
+        name = f'{name}.{extension}'
+    return f'{QR_CODES_DIR}/{name}'
+
+
+def qr_code_path_from_link(qr_code_link):
+    """Storage path of the image behind a student's qr_code_link"""
+    return qr_code_storage_path(qr_code_link.rstrip('/').rsplit('/', 1)[-1])
+
+
+def generate_qr_code(student_id):
+    """Return the QR code link of a single student"""
+    return QRRenderer().link(student_id)
@@ -0,0 +1,151 @@
+import threading
+from contextlib import contextmanager
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from certifications.certificates import invalidate_student_certificates, invalidate_template_certificates
+from certifications.exports import invalidate_qr_archives
+from certifications.models import CertificateTemplate, Issuer, QRArchive, RevokedCertificate, Student
+from certifications.tokens import QR_SIGNED_PAYLOADS, expire_student_tokens, revocations_changed, revoke_students
+from certifications.verification import (
+    invalidate_issuer_student_counts, invalidate_issuer_verification_pages, invalidate_verification_pages,
+)
+
+# Bulk writes (bulk_create/bulk_update, as used by the importer) send no
+# signals; their callers invalidate the export archives they touched.
+# Cached certificates are keyed on their inputs, so a missed invalidation
+# only leaves an unused file behind. Verification pages are dropped once the
+# change is committed, so a concurrent scan cannot cache the old data again.
+# Deleting many students (clear_database, cascades from the admin) invalidates
+# once for all of them inside deleting_students().
+
+
+def _archive_slice(student):
+    """(issuer_id, session) of a student, session None when it was not loaded"""
+    session = student.__dict__['session'] or '' if 'session' in student.__dict__ else None
+    return student.__dict__.get('issuer_id'), session
+
+
+@receiver(post_init, sender=Student)
+def remember_archive_slice(sender, instance, **kwargs):
+    # Read from __dict__ so deferred fields are not loaded
+    instance._loaded_archive_slice = _archive_slice(instance)
+
+
+@receiver(post_save, sender=Student)
+def invalidate_issuer_counts(sender, instance, **kwargs):
+    # Connected before invalidate_archives_on_save, which resets the loaded slice
+    issuer_ids = {instance.issuer_id, instance._loaded_archive_slice[0]} - {None}
+    transaction.on_commit(lambda: invalidate_issuer_student_counts(issuer_ids))
+
+
+@receiver(post_save, sender=Student)
+def invalidate_archives_on_save(sender, instance, created, **kwargs):
+    slices = {_archive_slice(instance)}
+    if not created and instance._loaded_archive_slice[0] is not None:
+        # The student may have moved out of its previous slice
+        slices.add(instance._loaded_archive_slice)
+    invalidate_qr_archives(slices)
+    instance._loaded_archive_slice = _archive_slice(instance)
+
+
+_deleted_students = threading.local()
+
+
+def _invalidate_deleted_students(students):
+    """Invalidate what deleted students appeared in, given their (id, issuer ids, archive slice)"""
+    student_ids = [student_id for student_id, _, _ in students]
+    issuer_ids = set().union(*(issuer_ids for _, issuer_ids, _ in students))
+    invalidate_qr_archives({archive_slice for _, _, archive_slice in students})
+    invalidate_student_certificates(student_ids)
+    if QR_SIGNED_PAYLOADS:
+        # Signed QR codes of the students carry their own data and stay readable
+        revoke_students(student_ids, 'Student deleted')
+
+    def invalidate_cached_pages():
+        invalidate_issuer_student_counts(issuer_ids)
+        invalidate_verification_pages(student_ids)
+    transaction.on_commit(invalidate_cached_pages)
+
+
+@contextmanager
+def deleting_students():
+    """Invalidate for the students deleted in the block together when it ends, rather than one by one"""
+    _deleted_students.students = students = []
+    try:
+        yield
+    finally:
+        _deleted_students.students = None
+    if students:
+        _invalidate_deleted_students(students)
+
+
+@receiver(post_delete, sender=Student)
+def invalidate_deleted_student(sender, instance, **kwargs):
+    issuer_ids = {instance.issuer_id, instance._loaded_archive_slice[0]} - {None}
+    student = (instance.id, issuer_ids, _archive_slice(instance))
+    pending = getattr(_deleted_students, 'students', None)
+    if pending is None:
+        _invalidate_deleted_students([student])
+    else:
+        pending.append(student)
+
+
+@receiver(post_save, sender=Issuer)
+def invalidate_issuer_archives(sender, instance, created, **kwargs):
+    # Archives list the issuer's name with every student
+    if not created:
+        invalidate_qr_archives({(instance.id, None)})
+
+
+@receiver(post_delete, sender=QRArchive)
+def delete_archive_file(sender, instance, **kwargs):
+    if instance.file:
+        default_storage.delete(instance.file.name)
+
+
+@receiver(post_save, sender=Student)
+def invalidate_student_certificate(sender, instance, **kwargs):
+    invalidate_student_certificates([instance.id])
+
+
+@receiver(post_save, sender=CertificateTemplate)
+@receiver(pre_delete, sender=CertificateTemplate)
+def invalidate_template_certificate(sender, instance, **kwargs):
+    # Before deletion, while its students still point to it
+    invalidate_template_certificates(instance)
+
+
+@receiver(post_save, sender=Student)
+def invalidate_student_verification(sender, instance, **kwargs):
+    student_id = instance.id
+    transaction.on_commit(lambda: invalidate_verification_pages([student_id]))
+
+
+@receiver(post_save, sender=Issuer)
+def invalidate_issuer_verification(sender, instance, **kwargs):
+    # Deleting an issuer deletes its students, which drop their own pages
+    transaction.on_commit(lambda: invalidate_issuer_verification_pages(instance))
+
+
+def remember_issuer_name(sender, instance, **kwargs):
+    instance._loaded_name_en = instance.__dict__.get('name_en')
+
+
+def expire_renamed_issuer_tokens(sender, instance, created, **kwargs):
+    # Signed QR codes carry the issuer's name
+    if not created and instance.name_en != instance._loaded_name_en:
+        expire_student_tokens(Student.objects.filter(issuer=instance))
+    instance._loaded_name_en = instance.name_en
+
+
+if QR_SIGNED_PAYLOADS:
+    post_init.connect(remember_issuer_name, sender=Issuer)
+    post_save.connect(expire_renamed_issuer_tokens, sender=Issuer)
+
+
+@receiver(post_save, sender=RevokedCertificate)
+@receiver(post_delete, sender=RevokedCertificate)
+def reload_revocations(sender, instance, **kwargs):
+    transaction.on_commit(revocations_changed)
@@ -0,0 +1,181 @@
+import io
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import connection
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+from certifications.exports import build_qr_archive
+from certifications.importer import (
+    ImportResult, ValidationReport, clean_row, count_csv_rows, import_students, iter_csv_rows, validate_students,
+)
+from certifications.models import CSVUpload
+from certifications.xlsx import check_normalised_row, count_xlsx_rows, iter_xlsx_records
+
+# Threads importing uploads inside the web process; 0 leaves pending uploads
+# to the `process_csv_uploads` management command.
+CSV_IMPORT_WORKERS = getattr(settings, 'CSV_IMPORT_WORKERS', 1)
+
+# Seconds without a heartbeat after which a started import is considered dead
+# and may be resumed by another worker
+CSV_IMPORT_LEASE = getattr(settings, 'CSV_IMPORT_LEASE', 300)
+
+_executor = None
+_archive_executor = None
+_archive_builds = set()
+_archive_builds_lock = threading.Lock()
+
+
+def enqueue_csv_upload(upload_id, resume=False):
+    """Hand a saved CSVUpload to the in-process background worker"""
+    global _executor
+    if not CSV_IMPORT_WORKERS:
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CSV_IMPORT_WORKERS, thread_name_prefix='csv-import')
+    _executor.submit(_run_in_thread, upload_id, resume)
+
+
+def _run_in_thread(upload_id, resume):
+    try:
+        process_csv_upload(upload_id, resume=resume)
+    finally:
+        # Worker threads get their own connection, don't leak it
+        connection.close()
+
+
+def enqueue_qr_archive_build(issuer_id, session=''):
+    """Build the export archive of a slice in the background, unless already being built"""
+    global _archive_executor
+    key = (issuer_id, session)
+    with _archive_builds_lock:
+        if key in _archive_builds:
+            return
+        _archive_builds.add(key)
+        if _archive_executor is None:
+            _archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qr-archive')
+    _archive_executor.submit(_build_archive_in_thread, issuer_id, session)
+
+
+def _build_archive_in_thread(issuer_id, session):
+    try:
+        build_qr_archive(issuer_id, session)
+    finally:
+        with _archive_builds_lock:
+            _archive_builds.discard((issuer_id, session))
+        connection.close()
+
+
+def is_xlsx(file_name):
+    return file_name.lower().endswith('.xlsx')
+
+
+def _lease_expiry():
+    return timezone.now() - timedelta(seconds=CSV_IMPORT_LEASE)
+
+
+def claim_csv_upload(upload_id, resume=False):
+    """
+    Mark an upload as started, returns False if another worker already has it.
+
+    With `resume`, an upload whose worker failed, or died without a heartbeat
+    for CSV_IMPORT_LEASE seconds, can be claimed again.
+    """
+    uploads = CSVUpload.objects.filter(id=upload_id, processed=False)
+    if resume:
+        uploads = uploads.filter(Q(heartbeat_at__isnull=True) | Q(heartbeat_at__lt=_lease_expiry()))
+    else:
+        uploads = uploads.filter(started_at__isnull=True)
+    now = timezone.now()
+    return uploads.update(started_at=now, heartbeat_at=now) == 1
+
+
+def can_resume_upload(upload):
+    """Whether a started upload is no longer being imported by a live worker"""
+    if upload.processed or upload.started_at is None:
+        return False
+    return upload.heartbeat_at is None or upload.heartbeat_at < _lease_expiry()
+
+
+def process_csv_upload(upload_id, resume=False):
+    """
+    Import the rows of a CSVUpload, recording progress on the upload.
+
+    Progress and errors are written in the transaction of each chunk, so
+    `processed_records` is always the offset of the last committed row and a
+    resumed import continues right after it. An import that fails records the
+    error and stays unprocessed, so it can be resumed. Dry-run uploads only validate
+    the file and attach a per-row report; they restart from scratch if resumed.
+    """
+    if not claim_csv_upload(upload_id, resume=resume):
+        return None
+
+    upload = CSVUpload.objects.get(id=upload_id)
+    logged_errors = 0
+
+    def save_progress(result):
+        nonlocal logged_errors
+        new_errors = result.error_messages[logged_errors:]
+        logged_errors = len(result.error_messages)
+        CSVUpload.objects.filter(id=upload_id).update(
+            processed_records=result.processed_count,
+            successful_records=result.success_count,
+            updated_records=result.update_count,
+            failed_records=result.error_count,
+            error_log=Concat(F('error_log'), Value(''.join(f'{error}\n' for error in new_errors))),
+            heartbeat_at=timezone.now(),
+        )
+
+    try:
+        with upload.file.open('rb') as uploaded_file:
+            if is_xlsx(upload.file.name):
+                total_records = count_xlsx_rows(uploaded_file)
+                rows = iter_xlsx_records(uploaded_file)
+                clean = check_normalised_row
+            else:
+                total_records = count_csv_rows(uploaded_file)
+                rows = iter_csv_rows(uploaded_file)
+                clean = clean_row
+            CSVUpload.objects.filter(id=upload_id).update(total_records=total_records, heartbeat_at=timezone.now())
+
+            if upload.dry_run:
+                _validate_upload(upload, rows, clean, save_progress)
+            else:
+                result = ImportResult(
+                    processed_count=upload.processed_records,
+                    success_count=upload.successful_records,
+                    error_count=upload.failed_records,
+                    update_count=upload.updated_records,
+                )
+                import_students(rows, on_progress=save_progress, clean=clean, result=result, upsert=upload.upsert)
+    except Exception as e:
+        # Chunks committed so far stay recorded, the upload can be resumed after them
+        CSVUpload.objects.filter(id=upload_id).update(
+            error_log=Concat(F('error_log'), Value(f'Error processing CSV file: {str(e)}\n')),
+            heartbeat_at=None,
+        )
+    else:
+        CSVUpload.objects.filter(id=upload_id).update(processed=True, heartbeat_at=None)
+    upload.refresh_from_db()
+    return upload
+
+
+def _validate_upload(upload, rows, clean, save_progress):
+    CSVUpload.objects.filter(id=upload.id).update(
+        processed_records=0, successful_records=0, updated_records=0, failed_records=0, error_log=''
+    )
+    with tempfile.TemporaryFile() as report_file:
+        report_text = io.TextIOWrapper(report_file, encoding='utf-8', newline='')
+        validate_students(
+            rows, ValidationReport(report_text), on_progress=save_progress, clean=clean, upsert=upload.upsert
+        )
+        report_text.flush()
+        report_text.detach()
+
+        report_file.seek(0)
+        upload.report.save(f'upload_{upload.id}_report.csv', File(report_file), save=False)
+    CSVUpload.objects.filter(id=upload.id).update(report=upload.report.name)
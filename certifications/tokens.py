@@ -0,0 +1,149 @@
+"""
+Signed QR code payloads.
+
+With QR_SIGNED_PAYLOADS, QR codes link to the verify_token view with the key
+certificate fields signed by django.core.signing instead of a student id.
+They are signed with QR_SIGNING_KEY, set in the environment, rather than
+the SECRET_KEY committed with the project. The view checks the signature
+and renders the fields it carries, so scans read nothing from the database
+and codes cannot be enumerated.
+
+A signed certificate stays valid until its student is revoked; deleting a
+student revokes it, and only then, so deletes cost nothing extra while
+signing is off. Changing a field a token carries, the issuer's name
+included, sets the student's qr_valid_after; tokens carry the value they
+were signed with, so older ones no longer verify, and carry no timestamp,
+so a student's QR code stays the same from one render to the next. Revoked
+student ids and valid-after times are kept in memory by each process and
+only reloaded when the revocation version in the shared verification cache
+changes.
+"""
+import uuid
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from certifications.models import RevokedCertificate, Student
+from certifications.verification import verification_cache
+
+QR_SIGNED_PAYLOADS = getattr(settings, 'QR_SIGNED_PAYLOADS', False)
+
+# Kept apart from SECRET_KEY, which is committed with the project
+QR_SIGNING_KEY = getattr(settings, 'QR_SIGNING_KEY', '')
+if QR_SIGNED_PAYLOADS and (not QR_SIGNING_KEY or QR_SIGNING_KEY == settings.SECRET_KEY):
+    raise ImproperlyConfigured('QR_SIGNED_PAYLOADS requires a QR_SIGNING_KEY of its own in the environment.')
+
+QR_TOKEN_SALT = 'certifications.qr-token'
+
+# Lookups signed into a token, in order, the last one as its version; keys of the verified certificate
+QR_TOKEN_LOOKUPS = ['id', 'noms_et_prenoms', 'numero', 'filiere', 'session', 'issuer__name_en', 'qr_valid_after']
+QR_TOKEN_KEYS = ['id', 'noms_et_prenoms', 'numero', 'filiere', 'session', 'issuer']
+
+# Student fields (as named by the importer and forms) a token is built from
+QR_TOKEN_FIELDS = frozenset(['noms_et_prenoms', 'numero', 'filiere', 'session', 'issuer'])
+
+# Students whose tokens are built per query
+QR_TOKEN_CHUNK_SIZE = 500
+
+REVOCATION_VERSION_KEY = 'verification:revocations'
+
+
+def _token_version(valid_after):
+    """qr_valid_after as the integer a token carries, in microseconds since the epoch (0 when unset)"""
+    if valid_after is None:
+        return 0
+    return int(valid_after.timestamp()) * 1000000 + valid_after.microsecond
+
+
+def _signer():
+    # No timestamp, so a student's token, and its QR image, only change with its fields
+    return signing.Signer(key=QR_SIGNING_KEY, salt=QR_TOKEN_SALT)
+
+
+def qr_token(values):
+    """Signed token of a student's QR_TOKEN_LOOKUPS values"""
+    *fields, valid_after = values
+    # A list keeps the payload, and so the QR code, small
+    return _signer().sign_object([*fields, _token_version(valid_after)], compress=True)
+
+
+def qr_tokens(student_ids):
+    """{student id: token} of the given students, one query per QR_TOKEN_CHUNK_SIZE ids"""
+    student_ids = list(student_ids)
+    tokens = {}
+    for start in range(0, len(student_ids), QR_TOKEN_CHUNK_SIZE):
+        students = Student.objects.filter(id__in=student_ids[start:start + QR_TOKEN_CHUNK_SIZE])
+        for values in students.values_list(*QR_TOKEN_LOOKUPS):
+            tokens[values[0]] = qr_token(values)
+    return tokens
+
+
+def read_qr_token(token):
+    """
+    Certificate fields of a token as a dict and the qr_valid_after version it
+    was signed with; raises signing.BadSignature if it was not signed by us
+    """
+    values = _signer().unsign_object(token)
+    if not isinstance(values, list) or len(values) != len(QR_TOKEN_KEYS) + 1:
+        raise signing.BadSignature('Unexpected payload')
+    return dict(zip(QR_TOKEN_KEYS, values)), values[-1]
+
+
+_revoked_ids = None
+_valid_after = None
+_revoked_version = None
+
+
+def _load_revocations():
+    """
+    (revoked ids, {student id: valid-after time}), from memory while the
+    shared revocation version is unchanged, which costs a cache read and no
+    database query
+    """
+    global _revoked_ids, _valid_after, _revoked_version
+    version = verification_cache().get(REVOCATION_VERSION_KEY)
+    if _revoked_ids is None or version != _revoked_version:
+        _revoked_ids = frozenset(RevokedCertificate.objects.values_list('student_id', flat=True))
+        _valid_after = {
+            student_id: _token_version(valid_after)
+            for student_id, valid_after in Student.objects.filter(
+                qr_valid_after__isnull=False
+            ).values_list('id', 'qr_valid_after')
+        }
+        _revoked_version = version
+    return _revoked_ids, _valid_after
+
+
+def revoked_student_ids():
+    """Ids of revoked students"""
+    return _load_revocations()[0]
+
+
+def is_outdated_token(student_id, version):
+    """Whether a token of the student signed with `version` predates a change of its fields"""
+    return version != _load_revocations()[1].get(student_id, 0)
+
+
+def revocations_changed():
+    """Make every process reload the revoked ids"""
+    verification_cache().set(REVOCATION_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def revoke_students(student_ids, reason):
+    """Revoke the given students, one INSERT per QR_TOKEN_CHUNK_SIZE ids; revoked ones are skipped"""
+    student_ids = list(student_ids)
+    for start in range(0, len(student_ids), QR_TOKEN_CHUNK_SIZE):
+        RevokedCertificate.objects.bulk_create(
+            [RevokedCertificate(student_id=student_id, reason=reason)
+             for student_id in student_ids[start:start + QR_TOKEN_CHUNK_SIZE]],
+            ignore_conflicts=True,
+        )
+    # bulk_create sends no post_save to reload_revocations
+    transaction.on_commit(revocations_changed)
+
+
+def expire_student_tokens(students):
+    """Stop the tokens signed so far for a queryset of students from verifying, and mark their QR codes stale"""
+    if students.update(qr_valid_after=timezone.now(), qr_fingerprint=''):
+        transaction.on_commit(revocations_changed)
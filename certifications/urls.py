@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = "certifications"
@@ -8,19 +8,32 @@ urlpatterns = [
     path('index/', views.index, name='index'),
     path('verify/<int:student_id>/', views.verify, name='verify'),
     path('upload-csv/', views.upload_csv, name='upload_csv'),
+    path('upload-csv/<int:upload_id>/', views.upload_status, name='upload_status'),
+    path('upload-csv/<int:upload_id>/progress/', views.upload_progress, name='upload_progress'),
+    path('upload-csv/<int:upload_id>/resume/', views.resume_upload, name='resume_upload'),
+    path('upload-csv/<int:upload_id>/report/', views.download_upload_report, name='download_upload_report'),
+    path('upload-csv/<int:upload_id>/import/', views.import_validated_upload, name='import_validated_upload'),
     path('download-sample-csv/', views.download_sample_csv, name='download_sample_csv'),
     path('download-qr-codes/', views.download_qr_codes, name='download_qr_codes'),
+    path('export-students/<str:export_format>/', views.export_students, name='export_students'),
+    path('qr-labels/', views.qr_labels, name='qr_labels'),
     path('regenerate-qr-codes/', views.regenerate_all_qr_codes, name='regenerate_qr_codes'),
+    re_path(r'^qr-codes/(?P<digest>[0-9a-f]{64})\.(?P<extension>png|svg)$', views.qr_image, name='qr_image'),
+    re_path(r'^qr/(?P<student_id>[0-9]+)\.(?P<extension>png|svg)$', views.student_qr_image, name='student_qr_image'),
     path('templates/', views.manage_templates, name='manage_templates'),
     path('templates/create/', views.create_template, name='create_template'),
     path('templates/edit/<int:template_id>/', views.edit_template, name='edit_template'),
     path('templates/delete/<int:template_id>/', views.delete_template, name='delete_template'),
     path('student/edit/<int:student_id>/', views.edit_student, name='edit_student'),
     path('student/delete/<int:student_id>/', views.delete_student, name='delete_student'),
+    path('student/<int:student_id>/certificate.pdf', views.certificate_pdf, name='certificate_pdf'),
     path('issuers/', views.list_issuers, name='list_issuers'),
     path('issuers/create/', views.create_issuer, name='create_issuer'),
     path('issuers/edit/<int:issuer_id>/', views.edit_issuer, name='edit_issuer'),
     path('verify-issuer/<uuid:uuid>/', views.verify_issuer, name='verify_issuer'),
     path('student-qr-info/<int:student_id>/', views.student_qr_info, name='student_qr_info'),
+    path('v/<str:token>/', views.verify_token, name='verify_token'),
+    path('api/verify/<int:student_id>/', views.api_verify, name='api_verify'),
+    path('api/verify/batch/', views.api_verify_batch, name='api_verify_batch'),
     path('clear_database/', views.clear_database, name='clear_database'),
 ]
@@ -0,0 +1,221 @@
+"""
+Verification pages served to QR code scans, cached per student.
+
+The rendered pages are kept in a cache shared by every worker process (see
+CACHES in settings), so a scan of an already rendered page costs no query
+and no template rendering. Saving or deleting a student or an issuer drops
+the pages it appears on; bulk writes, which send no signals, drop them
+explicitly. Verifier apps use the JSON records instead, revalidated with
+their ETag.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from certifications.models import Student
+
+# Alias in CACHES of the cache holding rendered verification pages
+VERIFICATION_CACHE = getattr(settings, 'VERIFICATION_CACHE', 'verification')
+
+# URL names of the cached pages
+VERIFICATION_PAGES = ('verify', 'student_qr_info')
+
+# Keys deleted per cache call when invalidating many students
+VERIFICATION_INVALIDATION_BATCH = 500
+
+# (JSON key, lookup) of the student columns returned by the verification API
+VERIFICATION_API_FIELDS = [
+    ('id', 'id'),
+    ('noms_et_prenoms', 'noms_et_prenoms'),
+    ('matricule', 'matricule'),
+    ('filiere', 'filiere'),
+    ('mention', 'mention'),
+    ('session', 'session'),
+    ('sexe', 'sexe'),
+    ('date_de_naissance', 'date_de_naissance'),
+    ('lieu_de_naissance', 'lieu_de_naissance'),
+    ('numero', 'numero'),
+    ('issuer', 'issuer__name_en'),
+    ('issue_date', 'issue_date'),
+]
+
+# Clients keep API responses but revalidate them with the ETag on every use
+VERIFICATION_API_CACHE_CONTROL = 'public, no-cache'
+
+# Students listed per page of the public issuer page
+ISSUER_PAGE_SIZE = getattr(settings, 'ISSUER_PAGE_SIZE', 50)
+# Columns the issuer page displays, and the keyset it pages over
+ISSUER_PAGE_FIELDS = ['id', 'noms_et_prenoms', 'matricule', 'filiere', 'mention', 'issue_date']
+
+# Unique columns batch verification looks students up by
+VERIFICATION_BATCH_FIELDS = ('numero', 'matricule')
+# Values accepted per batch request, and looked up per query
+VERIFICATION_BATCH_MAX_ITEMS = getattr(settings, 'VERIFICATION_BATCH_MAX_ITEMS', 1000)
+VERIFICATION_BATCH_CHUNK_SIZE = 500
+
+
+def verification_cache():
+    return caches[VERIFICATION_CACHE]
+
+
+def verification_cache_key(page, student_id):
+    return f'verification:{page}:{student_id}'
+
+
+def cached_verification_page(request, page, student_id, render_page):
+    """
+    Response of a verification page, from the cache or rendered by
+    `render_page()` and stored. Pages are rendered without the cache while
+    the visitor has pending flash messages, which the layout displays.
+    """
+    if len(messages.get_messages(request)):
+        return render_page()
+    cache = verification_cache()
+    key = verification_cache_key(page, student_id)
+    content = cache.get(key)
+    if content is None:
+        response = render_page()
+        cache.set(key, response.content)
+        return response
+    return HttpResponse(content)
+
+
+def verification_records(students):
+    """The students' API records as dicts, issuer included, in one query"""
+    lookups = [lookup for _, lookup in VERIFICATION_API_FIELDS]
+    for row in students.values_list(*lookups):
+        yield {key: value for (key, _), value in zip(VERIFICATION_API_FIELDS, row)}
+
+
+def verification_record(student_id):
+    """API record of one student, None if there is no such student"""
+    return next(verification_records(Student.objects.filter(id=student_id)), None)
+
+
+def verification_json(record):
+    """(JSON bytes, weak ETag) of an API record"""
+    content = json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    return content, f'W/"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def verify_batch(items):
+    """
+    Status of each (field, value) item, field being numero or matricule, in order.
+
+    Distinct values are looked up with one `__in` query per chunk and field,
+    so a batch costs a handful of queries however many items it has.
+    """
+    found = {}
+    for field in VERIFICATION_BATCH_FIELDS:
+        values = list({value for item_field, value in items if item_field == field})
+        for start in range(0, len(values), VERIFICATION_BATCH_CHUNK_SIZE):
+            chunk = values[start:start + VERIFICATION_BATCH_CHUNK_SIZE]
+            for record in verification_records(Student.objects.filter(**{f'{field}__in': chunk})):
+                found[field, record[field]] = record
+
+    results = []
+    for field, value in items:
+        record = found.get((field, value))
+        if record is None:
+            results.append({field: value, 'status': 'not_found'})
+        else:
+            results.append({field: value, 'status': 'verified', 'student': record})
+    return results
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _issuer_page_cursor(student):
+    """`after` value of the page following a student: its issue date in microseconds (blank when NULL), '_', its id"""
+    issue_date = student['issue_date']
+    micros = '' if issue_date is None else (issue_date - _EPOCH) // timedelta(microseconds=1)
+    return f'{micros}_{student["id"]}'
+
+
+def _parse_issuer_page_cursor(after):
+    """(issue_date, id) of an `after` value, raises ValueError when it is malformed"""
+    micros, _, student_id = after.partition('_')
+    if not student_id.isdigit() or micros and not micros.lstrip('-').isdigit():
+        raise ValueError(f'Invalid cursor {after!r}')
+    # Beyond a 64-bit id or the dates datetime holds, it was not made by us
+    if int(student_id) >= 2 ** 63:
+        raise ValueError(f'Invalid cursor {after!r}')
+    try:
+        issue_date = _EPOCH + timedelta(microseconds=int(micros)) if micros else None
+    except OverflowError:
+        raise ValueError(f'Invalid cursor {after!r}')
+    return issue_date, int(student_id)
+
+
+def issuer_students_page(issuer, after=None):
+    """
+    One page of an issuer's students, most recent first, and the `after`
+    value of the next page (None on the last page). Raises ValueError when
+    `after` is malformed.
+
+    Pages are found by keyset over (issue_date, id), carried by the cursor,
+    rather than by offset, so every page costs an index seek whatever its
+    position and deleting a student does not break the next link. Students
+    without an issue date come last, paged by id in a second pass.
+    """
+    issue_date, student_id = _parse_issuer_page_cursor(after) if after else (None, None)
+    students = Student.objects.filter(issuer=issuer)
+    limit = ISSUER_PAGE_SIZE + 1
+    page = []
+    if after is None or issue_date is not None:
+        dated = students.filter(issue_date__isnull=False).order_by('-issue_date', '-id')
+        if issue_date is not None:
+            # A range on the index, the rows of the cursor's own date are then filtered
+            dated = dated.filter(issue_date__lte=issue_date).exclude(issue_date=issue_date, id__gte=student_id)
+        page = list(dated.values(*ISSUER_PAGE_FIELDS)[:limit])
+    if len(page) < limit:
+        undated = students.filter(issue_date__isnull=True).order_by('-id')
+        if student_id is not None and issue_date is None:
+            undated = undated.filter(id__lt=student_id)
+        page += undated.values(*ISSUER_PAGE_FIELDS)[:limit - len(page)]
+    if len(page) > ISSUER_PAGE_SIZE:
+        return page[:ISSUER_PAGE_SIZE], _issuer_page_cursor(page[ISSUER_PAGE_SIZE - 1])
+    return page, None
+
+
+def issuer_count_cache_key(issuer_id):
+    return f'verification:issuer_count:{issuer_id}'
+
+
+def issuer_student_count(issuer_id):
+    """Number of students of an issuer, counted once and then read from the shared cache"""
+    cache = verification_cache()
+    key = issuer_count_cache_key(issuer_id)
+    count = cache.get(key)
+    if count is None:
+        count = Student.objects.filter(issuer_id=issuer_id).count()
+        cache.set(key, count)
+    return count
+
+
+def invalidate_issuer_student_counts(issuer_ids):
+    """Drop the cached student counts of the given issuers"""
+    verification_cache().delete_many([issuer_count_cache_key(issuer_id) for issuer_id in set(issuer_ids)])
+
+
+def invalidate_verification_pages(student_ids):
+    """Drop the cached verification pages of the given students"""
+    cache = verification_cache()
+    keys = []
+    for student_id in student_ids:
+        keys += [verification_cache_key(page, student_id) for page in VERIFICATION_PAGES]
+        if len(keys) >= VERIFICATION_INVALIDATION_BATCH:
+            cache.delete_many(keys)
+            keys = []
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_issuer_verification_pages(issuer):
+    """Drop the cached verification pages of an issuer's students"""
+    invalidate_verification_pages(Student.objects.filter(issuer=issuer).values_list('id', flat=True).iterator())
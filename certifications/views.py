@@ -1,21 +1,37 @@
-import io
 import csv
-import qrcode
-import zipfile
-import os
-from datetime import datetime
+import json
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, FileResponse
-from django.conf import settings
-from django.db import transaction, IntegrityError
+from django.http import HttpResponse, FileResponse, JsonResponse, HttpResponseNotModified, Http404, StreamingHttpResponse
+from django.db import IntegrityError, transaction
 from django.contrib import messages
-from django.core.files.base import ContentFile
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core import signing
 from django.core.files.storage import default_storage
-from django.urls import reverse
-from certifications.models import Student, QRCodeCustomization, Issuer, CertificateTemplate, CSVUpload, SampleCSV
+from certifications.models import Student, Issuer, CertificateTemplate, CSVUpload, SampleCSV
 from certifications.forms import CertificateTemplateForm, IssuerForm, StudentForm, CSVUploadForm
-from PIL import Image
+from certifications.certificates import CERTIFICATE_CACHE_CONTROL, cached_certificate
+from certifications.exports import (
+    EXPORT_SENDFILE_HEADER, EXPORT_SENDFILE_ROOT, QR_ARCHIVE_NAME, STUDENT_EXPORT_FORMATS, cached_qr_archive,
+    filter_students, invalidate_qr_archives, iter_qr_archive, student_export,
+)
+from certifications.importer import IMPORT_BATCH_SIZE, iter_csv_rows
+from certifications.labels import LABEL_PAGE_SIZES, iter_label_sheets
+from certifications.verification import (
+    VERIFICATION_API_CACHE_CONTROL, VERIFICATION_BATCH_FIELDS, VERIFICATION_BATCH_MAX_ITEMS, cached_verification_page,
+    invalidate_verification_pages, issuer_student_count, issuer_students_page, verification_json, verification_record,
+    verify_batch,
+)
+from certifications.tokens import (
+    expire_student_tokens, is_outdated_token, read_qr_token, revoked_student_ids,
+)
+from certifications.signals import deleting_students
+from certifications.tasks import can_resume_upload, enqueue_csv_upload, enqueue_qr_archive_build
+from certifications.qr import (
+    QR_CACHE_CONTROL, QR_CONTENT_TYPES, QR_FIELDS, QR_ON_DEMAND_CACHE_CONTROL, QRRenderer, qr_code_path_from_link,
+    qr_code_storage_path, shared_renderer, stale_students,
+)
 
 def home(request):
     return render(request, 'home.html')
@@ -34,17 +50,22 @@ def index(request):
         # If page is out of range (e.g. 9999), deliver last page of results.
         students = paginator.page(paginator.num_pages)
 
-    return render(request, 'index.html', {'students': students})
+    issuers = Issuer.objects.order_by('name_en')
+    return render(request, 'index.html', {'students': students, 'issuers': issuers})
 
 def regenerate_all_qr_codes(request):
-    """View to regenerate QR codes for all students"""
-    students = Student.objects.all()
-    count = 0
+    """View to regenerate the QR codes of students whose render inputs changed"""
+    renderer = QRRenderer()
+    students = list(stale_students(renderer).only('id', 'qr_code_link', 'qr_fingerprint'))
+    renderer.preload(student.id for student in students)
     for student in students:
-        qr_code_url = generate_qr_code(student.id)
-        student.qr_code_link = qr_code_url
-        student.save()
-        count += 1
+        student.qr_code_link = renderer.link(student.id)
+        student.qr_fingerprint = renderer.fingerprint
+    Student.objects.bulk_update(students, ['qr_code_link', 'qr_fingerprint'], batch_size=IMPORT_BATCH_SIZE)
+    count = len(students)
+    if count:
+        invalidate_qr_archives()
+        invalidate_verification_pages(student.id for student in students)
     
     messages.success(request, f'Successfully regenerated QR codes for {count} students.')
     return redirect('certifications:index')
@@ -62,63 +83,6 @@ def download_sample_csv(request):
     
     return response
 
-def generate_qr_code(student_id):
-    """Generate a single QR code for a student"""
-    qr_customization = QRCodeCustomization.objects.first()
-    if not qr_customization:
-        qr_customization = QRCodeCustomization.objects.create()
-
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    
-    # Get the relative URL using reverse
-    relative_url = reverse('certifications:student_qr_info', args=[student_id])
-    # Combine BASE_URL with 'certificate' prefix and the relative URL
-    student_url = f"{settings.BASE_URL.rstrip('/')}{relative_url}"
-    qr.add_data(student_url)
-    qr.make(fit=True)
-
-    qr_img = qr.make_image(fill_color=qr_customization.foreground_color, back_color=qr_customization.background_color)
-
-    if qr_customization.logo:
-        logo = Image.open(qr_customization.logo.path)
-        logo_size = (qr_img.size[0] // 4, qr_img.size[1] // 4)
-        logo = logo.resize(logo_size, Image.LANCZOS)
-        pos = ((qr_img.size[0] - logo.size[0]) // 2, (qr_img.size[1] - logo.size[1]) // 2)
-        qr_img.paste(logo, pos, logo)
-
-    # Save QR code image to media storage
-    qr_buffer = io.BytesIO()
-    qr_img.save(qr_buffer, format="PNG")
-    qr_buffer.seek(0)
-    
-    qr_code_path = f'qr_codes/student_{student_id}.png'
-    default_storage.save(qr_code_path, ContentFile(qr_buffer.getvalue()))
-    
-    # Return the full URL for the QR code
-    return f"{settings.BASE_URL}{settings.MEDIA_URL}{qr_code_path}"
-
-def convert_date_format(date_str):
-    """Convert date from DD/MM/YYYY to YYYY-MM-DD format"""
-    if not date_str:
-        return None
-    try:
-        # Parse the date string in DD/MM/YYYY format
-        date_obj = datetime.strptime(date_str.strip(), '%d/%m/%Y')
-        # Convert to YYYY-MM-DD format
-        return date_obj.strftime('%Y-%m-%d')
-    except ValueError:
-        try:
-            # Try parsing as YYYY-MM-DD in case it's already in the correct format
-            datetime.strptime(date_str.strip(), '%Y-%m-%d')
-            return date_str.strip()
-        except ValueError:
-            return None
-
 def upload_csv(request):
     if request.method == 'POST':
         if 'csv_file' not in request.FILES:
@@ -126,111 +90,123 @@ def upload_csv(request):
             return redirect('certifications:upload_csv')
 
         csv_file = request.FILES['csv_file']
-        if not csv_file.name.endswith('.csv'):
-            messages.error(request, 'File must be a CSV.')
+        if not csv_file.name.lower().endswith(('.csv', '.xlsx')):
+            messages.error(request, 'File must be a CSV or an Excel (.xlsx) workbook.')
             return redirect('certifications:upload_csv')
 
-        try:
-            # Try different encodings
-            encodings = ['utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
-            decoded_file = None
-            
-            for encoding in encodings:
-                try:
-                    csv_file.seek(0)  # Reset file pointer
-                    decoded_file = csv_file.read().decode(encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            
-            if decoded_file is None:
-                messages.error(request, 'Unable to decode CSV file. Please ensure it is properly encoded.')
-                return redirect('certifications:upload_csv')
-
-            csv_data = csv.DictReader(io.StringIO(decoded_file))
-            
-            success_count = 0
-            error_count = 0
-            skip_count = 0
-            error_messages = []
-
-            with transaction.atomic():
-                for row in csv_data:
-                    try:
-                        # Check if student with this matricule already exists
-                        matricule = row.get('matricule', '').strip()
-                        if not matricule:
-                            error_count += 1
-                            error_messages.append(f"Error in row {success_count + error_count + skip_count}: Missing matricule")
-                            continue
-
-                        if Student.objects.filter(matricule=matricule).exists():
-                            skip_count += 1
-                            continue
-
-                        # Get or create issuer
-                        issuer_name = row.get('issuer_name_en', '').strip()
-                        if not issuer_name:
-                            error_count += 1
-                            error_messages.append(f"Error in row {success_count + error_count + skip_count}: Missing issuer name")
-                            continue
-
-                        issuer, _ = Issuer.objects.get_or_create(
-                            name_en=issuer_name
-                        )
-
-                        # Convert date format
-                        date_de_naissance = convert_date_format(row.get('date_de_naissance', '').strip())
-
-                        # Create student record
-                        student = Student.objects.create(
-                            noms_et_prenoms=row.get('noms_et_prenoms', '').strip(),
-                            matricule=matricule,
-                            filiere=row.get('filiere', '').strip(),
-                            mention=row.get('mention', '').strip(),
-                            session=row.get('session', '').strip(),
-                            sexe=row.get('sexe', '').strip(),
-                            date_de_naissance=date_de_naissance,
-                            lieu_de_naissance=row.get('lieu_de_naissance', '').strip(),
-                            numero=row.get('numero', '').strip(),
-                            issuer=issuer
-                        )
-                        
-                        # Generate QR code for the student
-                        qr_code_url = generate_qr_code(student.id)
-                        student.qr_code_link = qr_code_url
-                        student.save()
-                        
-                        success_count += 1
-                    except Exception as e:
-                        error_count += 1
-                        error_messages.append(f"Error in row {success_count + error_count + skip_count}: {str(e)}")
-                        continue
-
-            if success_count > 0:
-                messages.success(request, f'Successfully imported {success_count} student records.')
-            if skip_count > 0:
-                messages.info(request, f'Skipped {skip_count} duplicate records.')
-            if error_count > 0:
-                messages.warning(request, f'Failed to import {error_count} records. Check the format and try again.')
-                for error in error_messages:
-                    messages.error(request, error)
-
-        except Exception as e:
-            messages.error(request, f'Error processing CSV file: {str(e)}')
-            return redirect('certifications:upload_csv')
-
-        return redirect('certifications:index')
+        upload = CSVUpload.objects.create(
+            file=csv_file,
+            dry_run=bool(request.POST.get('dry_run')),
+            upsert=bool(request.POST.get('upsert')),
+        )
+        enqueue_csv_upload(upload.id)
+        if upload.dry_run:
+            messages.info(request, 'File received, it is being validated in the background. Nothing will be imported.')
+        else:
+            messages.info(request, 'File received, students are being imported in the background.')
+        return redirect('certifications:upload_status', upload_id=upload.id)
 
     return render(request, 'upload_csv.html')
 
+def upload_status(request, upload_id):
+    upload = get_object_or_404(CSVUpload, id=upload_id)
+    return render(request, 'upload_status.html', {'upload': upload, 'can_resume': can_resume_upload(upload)})
+
+def resume_upload(request, upload_id):
+    """Continue an interrupted import from its last committed row"""
+    upload = get_object_or_404(CSVUpload, id=upload_id)
+    if request.method == 'POST' and can_resume_upload(upload):
+        enqueue_csv_upload(upload.id, resume=True)
+        messages.info(request, f'Resuming import after row {upload.processed_records}.')
+    elif request.method == 'POST' and not upload.processed:
+        messages.warning(request, 'This import is still running.')
+    return redirect('certifications:upload_status', upload_id=upload.id)
+
+def import_validated_upload(request, upload_id):
+    """Import a file that went through a validation-only run"""
+    upload = get_object_or_404(CSVUpload, id=upload_id, dry_run=True, processed=True)
+    if request.method != 'POST':
+        return redirect('certifications:upload_status', upload_id=upload.id)
+    import_upload = CSVUpload.objects.create(file=upload.file.name, upsert=upload.upsert)
+    enqueue_csv_upload(import_upload.id)
+    messages.info(request, 'Students are being imported in the background.')
+    return redirect('certifications:upload_status', upload_id=import_upload.id)
+
+def download_upload_report(request, upload_id):
+    upload = get_object_or_404(CSVUpload, id=upload_id)
+    if not upload.report:
+        messages.error(request, 'No validation report is available for this upload.')
+        return redirect('certifications:upload_status', upload_id=upload.id)
+    return FileResponse(upload.report.open('rb'), as_attachment=True, filename=f'upload_{upload.id}_report.csv')
+
+def upload_progress(request, upload_id):
+    upload = get_object_or_404(CSVUpload, id=upload_id)
+    return JsonResponse({
+        'id': upload.id,
+        'dry_run': upload.dry_run,
+        'started': upload.started_at is not None,
+        'processed': upload.processed,
+        'resumable': can_resume_upload(upload),
+        'total_records': upload.total_records,
+        'processed_records': upload.processed_records,
+        'successful_records': upload.successful_records,
+        'updated_records': upload.updated_records,
+        'skipped_records': upload.skipped_records,
+        'failed_records': upload.failed_records,
+    })
+
+def qr_image(request, digest, extension):
+    """Serve a stored QR image; its name is a hash of its inputs so it can be cached forever"""
+    etag = f'"{digest}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            qr_file = default_storage.open(qr_code_storage_path(digest, extension), 'rb')
+        except FileNotFoundError:
+            raise Http404('QR code not found')
+        response = FileResponse(qr_file, content_type=QR_CONTENT_TYPES[extension])
+    response['ETag'] = etag
+    response['Cache-Control'] = QR_CACHE_CONTROL
+    return response
+
+def student_qr_image(request, student_id, extension):
+    """
+    Render a student's QR code on demand, revalidated with a hash of its inputs.
+
+    The configured format is served whatever the extension, so links keep
+    working after the customization switches between PNG and SVG.
+    """
+    student_id = int(student_id)
+    if not Student.objects.filter(id=student_id).exists():
+        raise Http404('Student not found')
+    renderer = shared_renderer()
+    # Built once, a signed payload costs a query
+    data = renderer.student_url(student_id)
+    etag = f'"{renderer.content_digest(data)}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(renderer.render_cached(data), content_type=renderer.content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = QR_ON_DEMAND_CACHE_CONTROL
+    return response
+
 def verify(request, student_id):
-    student = get_object_or_404(Student, id=student_id)
+    return cached_verification_page(request, 'verify', student_id, lambda: _render_verify(request, student_id))
+
+def _render_verify(request, student_id):
+    student = get_object_or_404(Student.objects.select_related('issuer'), id=student_id)
     context = {'student': student}
     return render(request, 'student_verification.html', context)
 
 def student_qr_info(request, student_id):
-    student = get_object_or_404(Student, id=student_id)
+    return cached_verification_page(
+        request, 'student_qr_info', student_id, lambda: _render_student_qr_info(request, student_id)
+    )
+
+def _render_student_qr_info(request, student_id):
+    student = get_object_or_404(Student.objects.select_related('issuer'), id=student_id)
     # Add debug information to context
     context = {
         'student': student,
@@ -253,45 +229,174 @@ def student_qr_info(request, student_id):
     }
     return render(request, 'student_qr_info.html', context)
 
+def verify_token(request, token):
+    """Verify a signed QR code from the fields it carries, without reading the student"""
+    try:
+        certificate, version = read_qr_token(token)
+    except signing.BadSignature:
+        return render(request, 'student_token_verification.html', {'status': 'invalid'}, status=400)
+    if certificate['id'] in revoked_student_ids():
+        return render(request, 'student_token_verification.html',
+                      {'status': 'revoked', 'certificate': certificate}, status=410)
+    if is_outdated_token(certificate['id'], version):
+        return render(request, 'student_token_verification.html',
+                      {'status': 'outdated', 'certificate': certificate}, status=410)
+    return render(request, 'student_token_verification.html', {'status': 'valid', 'certificate': certificate})
+
+def api_verify(request, student_id):
+    """A student's verification record as JSON, answered with 304 when the client's copy is current"""
+    record = verification_record(student_id)
+    if record is None:
+        return JsonResponse({'error': 'Student not found'}, status=404)
+    content, etag = verification_json(record)
+    # Weak comparison: the W/ prefix is ignored on both sides
+    if etag[2:] in {tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')}:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = VERIFICATION_API_CACHE_CONTROL
+    return response
+
+def _batch_verification_items(request):
+    """
+    (field, value) items of a batch verification request: a JSON object with
+    "numeros" and/or "matricules" lists, or an uploaded CSV `file` with
+    numero and/or matricule columns
+    """
+    if 'file' in request.FILES:
+        items = []
+        for row in iter_csv_rows(request.FILES['file']):
+            for field in VERIFICATION_BATCH_FIELDS:
+                value = (row.get(field) or '').strip()
+                if value:
+                    items.append((field, value))
+            if len(items) > VERIFICATION_BATCH_MAX_ITEMS:
+                break
+        return items
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        raise ValueError('Send a JSON object or a CSV file.')
+    if not isinstance(data, dict):
+        raise ValueError('Send a JSON object with "numeros" and/or "matricules" lists.')
+    items = []
+    for field in VERIFICATION_BATCH_FIELDS:
+        values = data.get(f'{field}s', [])
+        if not isinstance(values, list):
+            raise ValueError(f'"{field}s" must be a list.')
+        for value in values:
+            # bool is an int, but true is not a numero
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                raise ValueError(f'"{field}s" must only contain strings or numbers.')
+            value = str(value).strip()
+            if value:
+                items.append((field, value))
+    return items
+
+@csrf_exempt
+@require_POST
+def api_verify_batch(request):
+    """Verify many numeros and matricules at once, one status per value in the order received"""
+    try:
+        items = _batch_verification_items(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not items:
+        return JsonResponse({'error': 'No numero or matricule given.'}, status=400)
+    if len(items) > VERIFICATION_BATCH_MAX_ITEMS:
+        return JsonResponse({'error': f'At most {VERIFICATION_BATCH_MAX_ITEMS} values per request.'}, status=400)
+
+    results = verify_batch(items)
+    verified = sum(1 for result in results if result['status'] == 'verified')
+    return JsonResponse({'count': len(results), 'verified': verified, 'results': results},
+                        json_dumps_params={'ensure_ascii': False})
+
+def certificate_pdf(request, student_id):
+    """A student's certificate, rendered once per version of its inputs and then served from disk"""
+    student = get_object_or_404(Student.objects.select_related('issuer', 'template'), id=student_id)
+    key, path = cached_certificate(student)
+    etag = f'"{key}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(default_storage.open(path, 'rb'), content_type='application/pdf',
+                                filename=f'certificate_{student.id}.pdf')
+    response['ETag'] = etag
+    response['Cache-Control'] = CERTIFICATE_CACHE_CONTROL
+    return response
+
 def download_qr_codes(request):
-    students = Student.objects.all()
-    
-    # Create a CSV file with student data and QR code links
-    csv_buffer = io.StringIO()
-    csv_writer = csv.writer(csv_buffer)
-    csv_writer.writerow(['Noms et Prénoms', 'Matricule', 'Filière', 'Mention', 'Session', 'Sexe', 'Date de Naissance', 'Lieu de Naissance', 'Numéro', 'Issuer', 'Issue Date', 'QR Code Link'])
-    
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        for student in students:
-            # Write student data to CSV
-            csv_writer.writerow([
-                student.noms_et_prenoms,
-                student.matricule,
-                student.filiere,
-                student.mention,
-                student.session,
-                student.sexe,
-                student.date_de_naissance,
-                student.lieu_de_naissance,
-                student.numero,
-                student.issuer.name_en,
-                student.issue_date,
-                student.qr_code_link
-            ])
-            
-            # Add QR code image to zip file if it exists
-            if student.qr_code_link:
-                qr_code_path = f'qr_codes/student_{student.id}.png'
-                if default_storage.exists(qr_code_path):
-                    with default_storage.open(qr_code_path, 'rb') as qr_file:
-                        zip_file.writestr(f'qr_codes/student_{student.id}.png', qr_file.read())
-        
-        # Add CSV file to zip
-        zip_file.writestr('student_data.csv', csv_buffer.getvalue())
-    
-    zip_buffer.seek(0)
-    response = FileResponse(zip_buffer, as_attachment=True, filename='student_qr_codes_and_data.zip')
+    """
+    ZIP of the students' data and QR codes, optionally for one issuer, session or filiere.
+
+    Issuer (and session) exports are served from a pre-built archive when one
+    is current; otherwise the ZIP is streamed while it is built and the
+    archive is built in the background for the next download.
+    """
+    issuer_id = request.GET.get('issuer', '')
+    session = request.GET.get('session', '').strip()
+    filiere = request.GET.get('filiere', '').strip()
+    if issuer_id and not issuer_id.isdigit():
+        raise Http404('Unknown issuer')
+
+    renderer = QRRenderer()
+    if issuer_id and not filiere:
+        archive = cached_qr_archive(issuer_id, session, renderer)
+        if archive is not None:
+            try:
+                return _archive_response(archive)
+            except FileNotFoundError:
+                pass
+        enqueue_qr_archive_build(int(issuer_id), session)
+
+    students = filter_students(issuer_id, session, filiere)
+    response = StreamingHttpResponse(iter_qr_archive(students, renderer), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{QR_ARCHIVE_NAME}"'
+    return response
+
+def _archive_response(archive):
+    """Send a built archive, handing the transfer to the web server when configured"""
+    if EXPORT_SENDFILE_HEADER:
+        response = HttpResponse(content_type='application/zip')
+        response[EXPORT_SENDFILE_HEADER] = f"{EXPORT_SENDFILE_ROOT.rstrip('/')}/{archive.file.name}"
+        response['Content-Disposition'] = f'attachment; filename="{QR_ARCHIVE_NAME}"'
+        return response
+    # FileResponse uses the server's wsgi.file_wrapper, i.e. sendfile() where available
+    return FileResponse(default_storage.open(archive.file.name, 'rb'), as_attachment=True, filename=QR_ARCHIVE_NAME)
+
+def export_students(request, export_format):
+    """Stream the students' data as CSV, JSONL or XLSX, with the QR export's filters and optional gzip"""
+    if export_format not in STUDENT_EXPORT_FORMATS:
+        raise Http404('Unknown export format')
+    issuer_id = request.GET.get('issuer', '')
+    if issuer_id and not issuer_id.isdigit():
+        raise Http404('Unknown issuer')
+    students = filter_students(issuer_id, request.GET.get('session', '').strip(), request.GET.get('filiere', '').strip())
+
+    content_type, file_name, chunks = student_export(students, export_format, gzip=bool(request.GET.get('gzip')))
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    return response
+
+def qr_labels(request):
+    """Stream printable sheets of QR labels, with the export filters and a configurable grid"""
+    issuer_id = request.GET.get('issuer', '')
+    columns = request.GET.get('columns', '3')
+    rows = request.GET.get('rows', '8')
+    page_size = request.GET.get('page_size', 'A4')
+    if issuer_id and not issuer_id.isdigit():
+        raise Http404('Unknown issuer')
+    if not (columns.isdigit() and rows.isdigit() and 1 <= int(columns) <= 20 and 1 <= int(rows) <= 30):
+        raise Http404('Invalid label grid')
+    if page_size not in LABEL_PAGE_SIZES:
+        raise Http404('Unknown page size')
+    students = filter_students(issuer_id, request.GET.get('session', '').strip(), request.GET.get('filiere', '').strip())
+
+    sheets = iter_label_sheets(students, columns=int(columns), rows=int(rows), page_size=page_size)
+    response = StreamingHttpResponse(sheets, content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="qr_labels.pdf"'
     return response
 
 def manage_templates(request):
@@ -334,11 +439,16 @@ def edit_student(request, student_id):
         if form.is_valid():
             try:
                 student = form.save()
-                # Regenerate QR code if it doesn't exist
-                if not student.qr_code_link:
-                    qr_code_url = generate_qr_code(student.id)
-                    student.qr_code_link = qr_code_url
-                    student.save()
+                # Regenerate the QR code if it doesn't exist or encodes a changed field
+                if not student.qr_code_link or QR_FIELDS.intersection(form.changed_data):
+                    if QR_FIELDS.intersection(form.changed_data):
+                        # Printed codes still carry the previous values
+                        expire_student_tokens(Student.objects.filter(id=student.id))
+                    renderer = QRRenderer()
+                    student.qr_code_link = renderer.link(student.id)
+                    student.qr_fingerprint = renderer.fingerprint
+                    # Keeps the qr_valid_after just written
+                    student.save(update_fields=['qr_code_link', 'qr_fingerprint'])
                 messages.success(request, f'Student record updated for {student.noms_et_prenoms}')
                 return redirect('certifications:index')
             except IntegrityError:
@@ -375,11 +485,19 @@ def list_issuers(request):
     return render(request, 'issuer_list.html', {'issuers': issuers})
 
 def verify_issuer(request, uuid):
+    """Public issuer page, listing its students a page at a time from the `after` cursor"""
     issuer = get_object_or_404(Issuer, uuid=uuid)
-    students = issuer.student_set.all()
+    after = request.GET.get('after', '')
+    try:
+        students, next_after = issuer_students_page(issuer, after or None)
+    except ValueError:
+        raise Http404('Invalid page')
     context = {
         'issuer': issuer,
         'students': students,
+        'student_count': issuer_student_count(issuer.id),
+        'next_after': next_after,
+        'is_first_page': not after,
     }
     return render(request, 'verify_issuer.html', context)
 
@@ -394,7 +512,7 @@ def delete_student(request, student_id):
     elif request.method == 'POST':
         # Delete the QR code file if it exists
         if student.qr_code_link:
-            qr_code_path = f'qr_codes/student_{student.id}.png'
+            qr_code_path = qr_code_path_from_link(student.qr_code_link)
             if default_storage.exists(qr_code_path):
                 default_storage.delete(qr_code_path)
         student.delete()
@@ -405,8 +523,9 @@ def delete_student(request, student_id):
 def clear_database(request):
     if request.method == 'POST':
         # Clear all data
-        Student.objects.all().delete()
-        Issuer.objects.all().delete()
+        with transaction.atomic(), deleting_students():
+            Student.objects.all().delete()
+            Issuer.objects.all().delete()
 
         messages.success(request, 'Database cleared successfully.')
         return redirect('certifications:index')  # Assuming 'certifications' is your app name
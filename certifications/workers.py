@@ -0,0 +1,115 @@
+"""
+Entry points for process pools.
+
+Pool workers are spawned rather than forked so they never share the parent's
+SQLite connection. They unpickle these functions before Django is configured,
+hence nothing here imports models at module level.
+
+run_batches() and ProgressReporter drive these pools from the management
+commands.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import django
+from django.apps import apps
+
+# Seconds between two progress lines of the batch commands
+PROGRESS_INTERVAL = 2
+
+_qr_renderer = None
+_certificate_engine = None
+
+
+def setup_django():
+    if not apps.ready:
+        django.setup()
+
+
+def run_batches(function, batches, workers, initializer, on_result, *args):
+    """
+    Call function(batch, *args) for every batch and hand each result to on_result.
+
+    With one worker the batches run in this process. Otherwise they run in a
+    spawned pool of `workers` processes, keeping a bounded number of batches
+    in flight so results are handled while the next batches are read.
+    """
+    if workers <= 1:
+        initializer()
+        for batch in batches:
+            on_result(function(batch, *args))
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=initializer) as pool:
+        pending = set()
+        for batch in batches:
+            pending.add(pool.submit(function, batch, *args))
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    on_result(future.result())
+        for future in wait(pending).done:
+            on_result(future.result())
+
+
+class ProgressReporter:
+    """
+    Throttled progress lines of a batch command.
+
+    `message` is formatted with done, total and rate (items per second), at
+    most every PROGRESS_INTERVAL seconds unless forced.
+    """
+
+    def __init__(self, stdout, total, message):
+        self.stdout = stdout
+        self.total = total
+        self.message = message
+        self.done = 0
+        self.started = self.last_report = time.monotonic()
+
+    def add(self, count):
+        self.done += count
+        self.report()
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        rate = self.done / max(now - self.started, 1e-6)
+        self.stdout.write(self.message.format(done=self.done, total=self.total, rate=rate))
+
+
+def init_qr_worker():
+    global _qr_renderer
+    setup_django()
+    from certifications.qr import QRRenderer
+    _qr_renderer = QRRenderer()
+
+
+def render_qr_batch(student_ids):
+    """Compute (and store, when pre-rendering) the QR codes of a batch, returning (id, link, fingerprint) triples"""
+    _qr_renderer.preload(student_ids)
+    return [(student_id, _qr_renderer.link(student_id), _qr_renderer.fingerprint) for student_id in student_ids]
+
+
+def init_certificate_worker():
+    global _certificate_engine
+    setup_django()
+    from certifications.certificates import CertificateEngine
+    _certificate_engine = CertificateEngine()
+
+
+def render_certificate_batch(student_ids, output_dir):
+    """Write the certificates of a batch as <output_dir>/certificate_<id>.pdf, returning the number written"""
+    from certifications.models import Student
+    students = Student.objects.filter(id__in=student_ids).select_related('issuer', 'template')
+    _certificate_engine.qr_renderer.preload(student_ids)
+    count = 0
+    for student in students:
+        with open(os.path.join(output_dir, f'certificate_{student.id}.pdf'), 'wb') as pdf_file:
+            pdf_file.write(_certificate_engine.render(student))
+        count += 1
+    return count
@@ -0,0 +1,97 @@
+from datetime import date, datetime
+import pandas as pd
+from openpyxl import load_workbook
+from certifications.importer import STUDENT_FIELDS, chunked
+
+# Worksheet rows normalised together as one DataFrame
+XLSX_FRAME_SIZE = 5000
+
+TEXT_COLUMNS = STUDENT_FIELDS + ['issuer_name_en']
+
+
+def _cell_text(value):
+    """Render an Excel cell the way it would appear in a CSV export"""
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        # Matricules and numeros typed as numbers come back as floats
+        return str(int(value))
+    return str(value)
+
+
+def normalise_frame(frame):
+    """
+    Normalise a DataFrame of raw worksheet values into Student field values.
+
+    Every column is handled in one vectorised pass: stripping, date parsing
+    in both accepted formats and sexe validation. Rows that cannot be
+    imported get a message in the `error` column.
+    """
+    for column in TEXT_COLUMNS + ['date_de_naissance']:
+        if column not in frame:
+            frame[column] = ''
+        frame[column] = frame[column].map(_cell_text).str.strip()
+
+    dates = frame['date_de_naissance']
+    parsed = pd.to_datetime(dates, format='%d/%m/%Y', errors='coerce')
+    parsed = parsed.fillna(pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce'))
+    frame['date_de_naissance'] = parsed.dt.strftime('%Y-%m-%d').astype(object).where(parsed.notna(), None)
+
+    frame['sexe'] = frame['sexe'].str.upper()
+    invalid_sexe = ~frame['sexe'].isin(['', 'M', 'F'])
+    frame['error'] = None
+    frame.loc[invalid_sexe, 'error'] = 'Invalid sexe ' + frame.loc[invalid_sexe, 'sexe'] + ', expected M or F'
+
+    return frame[TEXT_COLUMNS + ['date_de_naissance', 'error']]
+
+
+def check_normalised_row(record):
+    """`clean` hook for import_students: records are already normalised"""
+    error = record.pop('error')
+    if error:
+        raise ValueError(error)
+    return record
+
+
+def _open_sheet(xlsx_file):
+    xlsx_file.seek(0)
+    workbook = load_workbook(xlsx_file, read_only=True, data_only=True)
+    return workbook, workbook.worksheets[0]
+
+
+def _data_rows(sheet):
+    """Header of a worksheet and an iterator over its non-empty data rows"""
+    rows = sheet.iter_rows(values_only=True)
+    header = [_cell_text(value).strip() for value in next(rows, ())]
+    # Excel keeps formatting on trailing rows, they come back empty
+    return header, (row for row in rows if any(value is not None for value in row))
+
+
+def count_xlsx_rows(xlsx_file):
+    """Number of data rows of the first worksheet, counted as iter_xlsx_records reads them"""
+    workbook, sheet = _open_sheet(xlsx_file)
+    try:
+        # The dimensions may be missing and count formatted empty rows
+        _, rows = _data_rows(sheet)
+        return sum(1 for _ in rows)
+    finally:
+        workbook.close()
+
+
+def iter_xlsx_records(xlsx_file):
+    """
+    Yield normalised row dicts from the first worksheet of an XLSX file.
+
+    The worksheet is streamed in read-only mode and normalised
+    XLSX_FRAME_SIZE rows at a time, so memory stays bounded.
+    """
+    workbook, sheet = _open_sheet(xlsx_file)
+    try:
+        header, rows = _data_rows(sheet)
+        for block in chunked(rows, XLSX_FRAME_SIZE):
+            frame = pd.DataFrame(block, columns=header, dtype=object)
+            yield from normalise_frame(frame).to_dict('records')
+    finally:
+        workbook.close()
@@ -2,9 +2,13 @@ from datetime import timedelta
 from os import getenv, path
 from pathlib import Path
 
+from dotenv import load_dotenv
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+load_dotenv(BASE_DIR / '.env')
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-default-key-change-this-in-production'  # Change this in production!
 
@@ -116,3 +120,44 @@ SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 SECURE_HSTS_PRELOAD = True
 
 BASE_URL = 'https://certificate.virtualmindshub.com'
+
+# Bulk import: rows looked up per query and rows per INSERT/UPDATE statement
+IMPORT_CHUNK_SIZE = 500
+IMPORT_BATCH_SIZE = 500
+# Background threads importing CSV uploads in the web process (0 = use the
+# process_csv_uploads management command instead)
+CSV_IMPORT_WORKERS = 1
+# Seconds an import may go without progress before it can be resumed elsewhere
+CSV_IMPORT_LEASE = 300
+# Uploads are streamed from disk, so the limit only guards the media volume
+CSV_UPLOAD_MAX_SIZE = 250 * 1024 * 1024
+# QR codes are rendered on demand by default; True stores a PNG per student at
+# import time. QR_RENDER_CACHE_SIZE renders are kept in memory per process.
+QR_PRERENDER_IMAGES = False
+QR_RENDER_CACHE_SIZE = 1024
+# Pre-built export archives are sent by the web server when set, e.g.
+# 'X-Sendfile' with EXPORT_SENDFILE_ROOT = MEDIA_ROOT, or 'X-Accel-Redirect'
+# with the internal nginx location aliasing MEDIA_ROOT
+EXPORT_SENDFILE_HEADER = None
+EXPORT_SENDFILE_ROOT = ''
+# Rendered verification pages are shared by all gunicorn workers through the
+# file system; entries are dropped when their student or issuer changes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'verification': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'verification',
+        'TIMEOUT': 7 * 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 200000},
+    },
+}
+VERIFICATION_CACHE = 'verification'
+# Numeros and matricules accepted per batch verification request
+VERIFICATION_BATCH_MAX_ITEMS = 1000
+# QR codes carry the certificate fields signed with QR_SIGNING_KEY, verified
+# without a database query, instead of linking to the student's page. The key
+# is read from the environment (or .env) and must be set to enable signing.
+QR_SIGNED_PAYLOADS = False
+QR_SIGNING_KEY = getenv('QR_SIGNING_KEY', '')